@@ -21,6 +21,7 @@ else:
 # depending on the python version
 install_requires = [
     'jobrunner>=1.3.0',
+    'numpy',
     'PyVCF>=0.6.7',
     'setuptools', # needed during execution to load pkg_resources
     'psutil',
@@ -7,7 +7,7 @@ This is the top-level script for the collection of cfsan_snp_pipeline tools.
 from __future__ import absolute_import
 
 import argparse
-import psutil
+import importlib
 import sys
 import textwrap
 
@@ -15,22 +15,6 @@ from snppipeline import __version__
 from snppipeline import utils
 from snppipeline.utils import verbose_print
 
-from snppipeline import run
-from snppipeline import data
-from snppipeline import index_ref
-from snppipeline import map_reads
-from snppipeline import call_sites
-from snppipeline import filter_regions
-from snppipeline import merge_sites
-from snppipeline import call_consensus
-from snppipeline import merge_vcfs
-from snppipeline import snp_matrix
-from snppipeline import distance
-from snppipeline import snp_reference
-from snppipeline import collect_metrics
-from snppipeline import combine_metrics
-from snppipeline import purge
-
 # Ignore flake8 errors in this module
 # flake8: noqa
 
@@ -70,19 +54,50 @@ def not_implemented(args):
     print("The %s command will be added in a future release" % args.subparser_name)
 
 
-def parse_argument_list(argv):
-    """Parse command line arguments.
+def lazy_subcommand(module_name, function_name):
+    """Return a function running a subcommand, importing its module on first use.
+
+    Importing every subcommand module when this script starts makes all
+    invocations pay the full import cost -- even trivial ones like --version
+    or --help.  Deferring the import until the subcommand is dispatched keeps
+    startup fast.
 
     Parameters
     ----------
-    argv : list
-        List of command line arguments, usually sys.argv[1:].
+    module_name : str
+        Name of the snppipeline submodule implementing the subcommand.
+    function_name : str
+        Name of the function within the submodule.
 
     Returns
     -------
-    args : Namespace
-        Command line arguments are stored as attributes of a Namespace.
+    dispatch : function
+        Function taking the parsed argument namespace, which imports the
+        submodule and runs the named function.
     """
+    def dispatch(args):
+        module = importlib.import_module("snppipeline." + module_name)
+        return getattr(module, function_name)(args)
+    return dispatch
+
+
+_parser = None # memoized parser, constructed once per process on first use
+
+def construct_parser():
+    """Construct the argument parser with all its subcommand parsers.
+
+    The parser is built once per process and memoized -- repeated calls
+    return the same parser object.
+
+    Returns
+    -------
+    parser : ArgumentParser
+        Parser with one subparser per subcommand.
+    """
+    global _parser
+    if _parser is not None:
+        return _parser
+
     # Create the top-level parser
     description = """The CFSAN SNP Pipeline is a collection of tools using reference-based
                      alignments to call SNPs for a set of samples."""
@@ -202,8 +217,12 @@ def parse_argument_list(argv):
     subparser.add_argument("--purge", dest="purge", action="store_true", help='Purge the intermediate output files (the entire "samples" directory) when the pipeline completes successfully.')
     subparser.add_argument("-v", "--verbose", dest="verbose",   type=int, default=1, metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=run.run)
-    subparser.set_defaults(excepthook=run.handle_exception)
+    def run_excepthook(exc_type, exc_value, exc_traceback):
+        from snppipeline import run
+        run.handle_exception(exc_type, exc_value, exc_traceback)
+
+    subparser.set_defaults(func=lazy_subcommand("run", "run"))
+    subparser.set_defaults(excepthook=run_excepthook)
 
     # -------------------------------------------------------------------------
     # Create the parser for the "data" command
@@ -248,7 +267,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     already exists.  Otherwise the destination directory is created and the
     data files are copied there.  (default: current directory)""")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=data.copy_data)
+    subparser.set_defaults(func=lazy_subcommand("data", "copy_data"))
     subparser.set_defaults(excepthook=None) # keep default exception handler
     subparser.set_defaults(verbose=0)
 
@@ -263,7 +282,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-f", "--force",   dest="forceFlag", action="store_true", help="Force processing even when result files already exist and are newer than inputs")
     subparser.add_argument("-v", "--verbose", dest="verbose",   type=int, default=1, metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=index_ref.index_ref)
+    subparser.set_defaults(func=lazy_subcommand("index_ref", "index_ref"))
     subparser.set_defaults(excepthook=utils.handle_global_exception)
 
     # -------------------------------------------------------------------------
@@ -271,7 +290,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     # -------------------------------------------------------------------------
     def threads(value):
         ivalue = int(value)
-        num_local_cpu_cores = psutil.cpu_count()
+        num_local_cpu_cores = utils.logical_cpu_count()
         if ivalue < 1 or ivalue > (2 * num_local_cpu_cores):
             raise argparse.ArgumentTypeError("Number of threads must be between %d and %d" % (1, 2 * num_local_cpu_cores))
         return ivalue
@@ -287,9 +306,26 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-v", "--verbose", dest="verbose",   type=int, default=1, metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--threads", dest="threads",   type=threads, default=8, metavar="INT", help="Number of CPU cores to use")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=map_reads.map_reads)
+    subparser.set_defaults(func=lazy_subcommand("map_reads", "map_reads"))
     subparser.set_defaults(excepthook=utils.handle_sample_exception)
 
+    # -------------------------------------------------------------------------
+    # Create the parser for the "map_reads_all" command
+    # -------------------------------------------------------------------------
+    description = """Align the sequence reads for all samples to a specified reference genome in a
+                     single invocation.  The samples are aligned one after another within one process,
+                     keeping the reference index warm in the file system cache between samples.
+                     The output is written to the file "reads.sorted.deduped.indelrealigned.bam" in each sample directory."""
+    subparser = subparsers.add_parser("map_reads_all", help="Align reads to the reference for all samples", description=description, formatter_class=formatter_class)
+    subparser.add_argument(dest="referenceFile",  type=str, help="Relative or absolute path to the reference fasta file")
+    subparser.add_argument(dest="sampleDirsFile", type=str, help="Relative or absolute path to file containing a list of directories -- one per sample")
+    subparser.add_argument("-f", "--force",   dest="forceFlag", action="store_true", help="Force processing even when result files already exist and are newer than inputs")
+    subparser.add_argument("-v", "--verbose", dest="verbose",   type=int, default=1, metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
+    subparser.add_argument("--threads", dest="threads",   type=threads, default=8, metavar="INT", help="Number of CPU cores to use")
+    subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
+    subparser.set_defaults(func=lazy_subcommand("map_reads", "map_reads_batch"))
+    subparser.set_defaults(excepthook=utils.handle_global_exception)
+
     # -------------------------------------------------------------------------
     # Create the parser for the "call_sites" command
     # -------------------------------------------------------------------------
@@ -300,7 +336,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-f", "--force",   dest="forceFlag", action="store_true", help="Force processing even when result files already exist and are newer than inputs")
     subparser.add_argument("-v", "--verbose", dest="verbose",   type=int, default=1, metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=call_sites.call_sites)
+    subparser.set_defaults(func=lazy_subcommand("call_sites", "call_sites"))
     subparser.set_defaults(excepthook=utils.handle_sample_exception)
 
     # -------------------------------------------------------------------------
@@ -320,7 +356,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-M", "--mode",        dest="mode",           choices=["all", "each"], default="all",                  help="Control whether dense snp regions found in any sample are filtered from all of the samples, or each sample independently.")
     subparser.add_argument("-v", "--verbose",     dest="verbose",        type=int, default=1,             metavar="0..5",         help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=filter_regions.filter_regions)
+    subparser.set_defaults(func=lazy_subcommand("filter_regions", "filter_regions"))
     subparser.set_defaults(excepthook=utils.handle_global_exception)
 
     # -------------------------------------------------------------------------
@@ -336,7 +372,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-o", "--output",  dest="snpListFile",    type=str, default="snplist.txt", metavar="FILE", help="Output file.  Relative or absolute path to the SNP list file")
     subparser.add_argument("-v", "--verbose", dest="verbose",        type=int, default=1,             metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=merge_sites.merge_sites)
+    subparser.set_defaults(func=lazy_subcommand("merge_sites", "merge_sites"))
     subparser.set_defaults(excepthook=utils.handle_global_exception)
 
     # -------------------------------------------------------------------------
@@ -406,7 +442,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument(      "--vcfFailedSnpGt",     dest="vcfFailedSnpGt",     type=str,            default='.',                choices=['.','0','1'], help=help["vcfFailedSnpGt"], )
     subparser.add_argument("-v", "--verbose",            dest="verbose",            type=int,            default=1,                  metavar="0..5", help=help["verbose"])
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=call_consensus.call_consensus)
+    subparser.set_defaults(func=lazy_subcommand("call_consensus", "call_consensus"))
     subparser.set_defaults(excepthook=utils.handle_sample_exception)
 
     # -------------------------------------------------------------------------
@@ -418,9 +454,11 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-f", "--force",   dest="forceFlag", action="store_true", help="Force processing even when result files already exist and are newer than inputs")
     subparser.add_argument("-n", "--vcfname", dest="vcfFileName",   type=str, default="consensus.vcf", metavar="NAME", help="File name of the vcf files which must exist in each of the sample directories")
     subparser.add_argument("-o", "--output",  dest="mergedVcfFile", type=str, default="snpma.vcf",     metavar="FILE", help="Output file.  Relative or absolute path to the merged multi-vcf file")
+    subparser.add_argument("-j", "--jobs",    dest="jobs", type=int, default=utils.physical_cpu_count(), metavar="INT", help="Number of samples to prepare in parallel")
+    subparser.add_argument("--threads",       dest="threads", type=int, default=utils.physical_cpu_count(), metavar="INT", help="Number of bcftools merge worker threads")
     subparser.add_argument("-v", "--verbose", dest="verbose",   type=int, default=1, metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=merge_vcfs.merge_vcfs)
+    subparser.set_defaults(func=lazy_subcommand("merge_vcfs", "merge_vcfs"))
     subparser.set_defaults(excepthook=utils.handle_global_exception)
 
     # -------------------------------------------------------------------------
@@ -439,7 +477,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-o", "--output",         dest="snpmaFile",          type=str,   default="snpma.fasta",      metavar="FILE", help="Output file.  Relative or absolute path to the SNP matrix file")
     subparser.add_argument("-v", "--verbose",        dest="verbose",            type=int,   default=1,                  metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=snp_matrix.create_snp_matrix)
+    subparser.set_defaults(func=lazy_subcommand("snp_matrix", "create_snp_matrix"))
     subparser.set_defaults(excepthook=utils.handle_global_exception)
 
     # -------------------------------------------------------------------------
@@ -453,7 +491,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-m", "--matrix", dest="matrixFile",   type=str, default=None,             metavar="FILE",          help="Relative or absolute path to the distance matrix output file.")
     subparser.add_argument("-v", "--verbose", dest="verbose",     type=int, default=1,                metavar="0..5",          help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=distance.calculate_snp_distances)
+    subparser.set_defaults(func=lazy_subcommand("distance", "calculate_snp_distances"))
     subparser.set_defaults(excepthook=utils.handle_global_exception)
 
     # -------------------------------------------------------------------------
@@ -467,7 +505,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-o", "--output",         dest="snpRefFile",    type=str, default="referenceSNP.fasta", metavar="FILE", help="Output file.  Relative or absolute path to the SNP reference sequence file")
     subparser.add_argument("-v", "--verbose",        dest="verbose",       type=int, default=1,                    metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=snp_reference.create_snp_reference_seq)
+    subparser.set_defaults(func=lazy_subcommand("snp_reference", "create_snp_reference_seq"))
     subparser.set_defaults(excepthook=utils.handle_global_exception)
 
     # -------------------------------------------------------------------------
@@ -486,7 +524,7 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-V", dest="consensusPreservedVcfFileName",       type=str, default="consensus_preserved.vcf",   metavar="NAME", help="File name of the consensus preserved vcf file which must exist in the sample directory")
     subparser.add_argument("--verbose", dest="verbose",                      type=int, default=1,                           metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=collect_metrics.collect_metrics)
+    subparser.set_defaults(func=lazy_subcommand("collect_metrics", "collect_metrics"))
     subparser.set_defaults(excepthook=utils.handle_sample_exception)
 
     # -------------------------------------------------------------------------
@@ -504,10 +542,11 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument("-f", "--force",   dest="forceFlag", action="store_true", help="Force processing even when result files already exist and are newer than inputs")
     subparser.add_argument("-n", "--metrics", dest="metricsFileName", type=str, default="metrics", metavar="NAME", help="File name of the metrics files which must exist in each of the sample directories.")
     subparser.add_argument("-o", "--output",  dest="mergedMetricsFile", type=str, default="metrics.tsv", metavar="FILE", help="Output file. Relative or absolute path to the combined metrics file.")
+    subparser.add_argument("-j", "--jobs",    dest="jobs", type=int, default=utils.physical_cpu_count(), metavar="INT", help="Number of sample metrics files to parse in parallel")
     subparser.add_argument("-s", "--spaces",  dest="spaceHeadings", action="store_true", help="Emit column headings with spaces instead of underscores")
     subparser.add_argument("-v", "--verbose", dest="verbose",   type=int, default=1, metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=combine_metrics.combine_metrics)
+    subparser.set_defaults(func=lazy_subcommand("combine_metrics", "combine_metrics"))
     subparser.set_defaults(excepthook=utils.handle_global_exception)
 
     # -------------------------------------------------------------------------
@@ -518,12 +557,27 @@ $ cfsan_snp_pipeline data lambdaVirusInputs testLambdaVirus
     subparser.add_argument(dest="work_dir",    type=str, help='Path to the working directory containing the "samples" directory to be recursively deleted')
     subparser.add_argument("-v", "--verbose", dest="verbose",   type=int, default=1, metavar="0..5", help="Verbose message level (0=no info, 5=lots)")
     subparser.add_argument("--version", action="version", version="%(prog)s version " + __version__)
-    subparser.set_defaults(func=purge.purge)
+    subparser.set_defaults(func=lazy_subcommand("purge", "purge"))
     subparser.set_defaults(excepthook=None)
 
-    # -------------------------------------------------------------------------
-    # parse the args
-    # -------------------------------------------------------------------------
+    _parser = parser
+    return parser
+
+
+def parse_argument_list(argv):
+    """Parse command line arguments.
+
+    Parameters
+    ----------
+    argv : list
+        List of command line arguments, usually sys.argv[1:].
+
+    Returns
+    -------
+    args : Namespace
+        Command line arguments are stored as attributes of a Namespace.
+    """
+    parser = construct_parser()
     args = parser.parse_args(argv)
 
     # Special validation
@@ -642,4 +696,9 @@ def main():
     -------
     The return value is passed to sys.exit()
     """
+    # Fast path for --version: skip building the full parser tree
+    if sys.argv[1:] == ["--version"]:
+        print(utils.program_name() + " version " + __version__)
+        return 0
+
     return run_command_from_arg_list(sys.argv[1:])
@@ -7,10 +7,65 @@ from __future__ import absolute_import
 
 import os
 
+from concurrent import futures
+
 from snppipeline import utils
 from snppipeline.utils import verbose_print
 
 
+# Output column headings and the metrics property supplying each column's value
+column_sources = [
+    ("Sample", "sample"),
+    ("Fastq Files", "fastqFileList"),
+    ("Fastq File Size", "fastqFileSize"),
+    ("Machine", "machine"),
+    ("Flowcell", "flowcell"),
+    ("Number of Reads", "numberReads"),
+    ("Duplicate Reads", "numberDupReads"),
+    ("Percent of Reads Mapped", "percentReadsMapped"),
+    ("Percent Proper Pair", "percentProperPair"),
+    ("Average Insert Size", "aveInsertSize"),
+    ("Average Pileup Depth", "avePileupDepth"),
+    ("Phase1 SNPs", "phase1Snps"),
+    ("Phase1 Preserved SNPs", "phase1SnpsPreserved"),
+    ("Phase2 SNPs", "snps"),
+    ("Phase2 Preserved SNPs", "snpsPreserved"),
+    ("Missing SNP Matrix Positions", "missingPos"),
+    ("Missing Preserved SNP Matrix Positions", "missingPosPreserved"),
+    ("Excluded Sample", "excludedSample"),
+    ("Excluded Preserved Sample", "excludedSamplePreserved"),
+    ("Warnings and Errors", "errorList"),
+]
+
+# Metrics properties whose values are quoted in the output
+quoted_columns = frozenset(["sample", "fastqFileList", "errorList"])
+
+
+def read_sample_metrics(metrics_file):
+    """Read the metrics file for a single sample.
+
+    This function processes one sample and is intended to run either serially
+    or in a pool of worker processes.
+
+    Parameters
+    ----------
+    metrics_file : str
+        Path to the metrics file for a sample.
+
+    Returns
+    -------
+    message : str or None
+        Error message if the metrics file is missing or empty, None otherwise.
+    metrics : dict or None
+        Dictionary mapping metric names to values, or None upon error.
+    """
+    if not os.path.isfile(metrics_file):
+        return ("Sample metrics file %s does not exist." % metrics_file, None)
+    if os.path.getsize(metrics_file) == 0:
+        return ("Sample metrics file %s is empty." % metrics_file, None)
+    return (None, utils.read_properties(metrics_file))
+
+
 def combine_metrics(args):
     """Combine the per-sample metrics files into a single table of metrics for all samples.
 
@@ -50,12 +105,15 @@ def combine_metrics(args):
     with open(sample_directories_list_path, "r") as f:
         sample_directories = [line.rstrip() for line in f]
     sample_directories = [d for d in sample_directories if d]
-    metrics_files = [os.path.join(d, metrics_file_name) for d in sample_directories]
+
+    # Scan each sample directory once and cache the stat results, so the
+    # freshness check below issues no extra syscalls per metrics file
+    metrics_files, metrics_file_stats = utils.collect_sample_files(sample_directories, metrics_file_name)
 
     #==========================================================================
     # Check if merge has already been done
     #==========================================================================
-    needs_rebuild = utils.target_needs_rebuild(metrics_files, merged_metrics_path)
+    needs_rebuild = utils.target_needs_rebuild_stats(metrics_file_stats.values(), merged_metrics_path)
     if not args.forceFlag and not needs_rebuild:
         verbose_print("# The merged metrics file is already freshly created.  Use the -f option to force a rebuild.")
         return
@@ -64,53 +122,37 @@ def combine_metrics(args):
     # Parse the metrics files and print the tabular results
     #==========================================================================
 
+    # Parse the per-sample metrics files -- in parallel when possible.
+    # The results are kept in sample order regardless of the number of jobs.
+    num_jobs = args.jobs or 1
+    if num_jobs > 1:
+        with futures.ProcessPoolExecutor(max_workers=num_jobs) as executor:
+            sample_metrics_list = list(executor.map(read_sample_metrics, metrics_files))
+    else:
+        sample_metrics_list = [read_sample_metrics(metrics_file) for metrics_file in metrics_files]
+
     with open(merged_metrics_path, 'w') as f:
         # Emit the column headings
-        column_headings = ["Sample", "Fastq Files", "Fastq File Size", "Machine", "Flowcell", "Number of Reads", "Duplicate Reads", "Percent of Reads Mapped",
-                           "Percent Proper Pair",
-                           "Average Insert Size", "Average Pileup Depth", "Phase1 SNPs", "Phase1 Preserved SNPs", "Phase2 SNPs", "Phase2 Preserved SNPs",
-                           "Missing SNP Matrix Positions", "Missing Preserved SNP Matrix Positions", "Excluded Sample", "Excluded Preserved Sample", "Warnings and Errors"]
+        column_headings = [heading for heading, key in column_sources]
         if not args.spaceHeadings:
             column_headings = [heading.replace(' ', '_') for heading in column_headings]
 
         tabbed_headings = '\t'.join(column_headings)
         f.write(tabbed_headings + '\n')
 
-        # Reads the metrics from each sample, and emit the values
-        for metrics_file in metrics_files:
-            verbose_print("Processing " + metrics_file)
-            message = None
-            if not os.path.isfile(metrics_file):
-                message = "Sample metrics file %s does not exist." % metrics_file
-            elif os.path.getsize(metrics_file) == 0:
-                message = "Sample metrics file %s is empty." % metrics_file
+        # Emit one row of tab-separated values per sample.  Each row is joined
+        # into a single string and written with one call, instead of issuing a
+        # separate write per cell.
+        for metrics_file, (message, metrics) in zip(metrics_files, sample_metrics_list):
+            utils.vprint(1, lambda: "Processing " + metrics_file)
             if message:
                 f.write(message + '\n')
                 utils.sample_warning(message)
                 continue
 
-            metrics = utils.read_properties(metrics_file)
-
-            f.write(quoted(metrics.get("sample", "")) + '\t')
-            f.write(quoted(metrics.get("fastqFileList", "")) + '\t')
-            f.write(metrics.get("fastqFileSize", "") + '\t')
-            f.write(metrics.get("machine", "") + '\t')
-            f.write(metrics.get("flowcell", "") + '\t')
-            f.write(metrics.get("numberReads", "") + '\t')
-            f.write(metrics.get("numberDupReads", "") + '\t')
-            f.write(metrics.get("percentReadsMapped", "") + '\t')
-            f.write(metrics.get("percentProperPair", "") + '\t')
-            f.write(metrics.get("aveInsertSize", "") + '\t')
-            f.write(metrics.get("avePileupDepth", "") + '\t')
-            f.write(metrics.get("phase1Snps", "") + '\t')
-            f.write(metrics.get("phase1SnpsPreserved", "") + '\t')
-            f.write(metrics.get("snps", "") + '\t')
-            f.write(metrics.get("snpsPreserved", "") + '\t')
-            f.write(metrics.get("missingPos", "") + '\t')
-            f.write(metrics.get("missingPosPreserved", "") + '\t')
-            f.write(metrics.get("excludedSample", "") + '\t')
-            f.write(metrics.get("excludedSamplePreserved", "") + '\t')
-            f.write(quoted(metrics.get("errorList", "")) + '\n')
+            values = [quoted(metrics.get(key, "")) if key in quoted_columns else metrics.get(key, "")
+                      for heading, key in column_sources]
+            f.write('\t'.join(values) + '\n')
 
 
 def quoted(text):
@@ -4,6 +4,7 @@ This module contains functions to run external commands/programs.
 
 from __future__ import print_function
 from __future__ import absolute_import
+import signal
 import subprocess
 import sys
 
@@ -81,3 +82,75 @@ def run(command, outfile=None):
     else:
         with open(outfile, "wb") as out:
             subprocess.check_call(command, stdout=out, shell=True)
+
+
+def run_pipeline(commands, outfile=None):
+    """Run a chain of commands connected with pipes, each as a separate process.
+
+    The stdout of each command feeds the stdin of the next command, so the
+    intermediate data never touches the disk.  The stderr file handles are
+    inherited from the calling Python program.
+
+    Parameters
+    ----------
+    commands : list of str
+        Commands to run with command line options and arguments.
+    outfile : str, optional
+        Path to stdout output file for the last command.  You can also specify
+        sys.stdout to inherit the stdout from the calling Python program.
+
+    Raises
+    ------
+    CalledProcessError on non-zero exitcode of any command in the chain
+
+    Examples
+    --------
+    # Verify the commands are connected and stdout written to a file
+    >>> import os
+    >>> from tempfile import NamedTemporaryFile
+    >>> fout = NamedTemporaryFile(delete=False, mode='w'); fout.close()
+    >>> run_pipeline(["echo hello world", "tr a-z A-Z"], fout.name)
+    >>> f = open(fout.name); out = f.read(); f.close(); os.unlink(fout.name)
+    >>> print(out.strip())
+    HELLO WORLD
+
+    # Verify a failure anywhere in the chain is detected
+    >>> run_pipeline(["echo hello world", "exit 3", "tr a-z A-Z"], fout.name)
+    Traceback (most recent call last):
+    ...
+    subprocess.CalledProcessError: Command 'exit 3' returned non-zero exit status 3.
+    >>> os.unlink(fout.name)
+    """
+    sys.stdout.flush() # flush stdout to keep the unbuffered stderr in chronological order with stdout
+
+    out = None
+    if outfile is not None and outfile != sys.stdout:
+        out = open(outfile, "wb")
+
+    try:
+        procs = []
+        prev_stdout = None
+        last_index = len(commands) - 1
+        for index, command in enumerate(commands):
+            stdout = subprocess.PIPE if index < last_index else out
+            proc = subprocess.Popen(command, shell=True, stdin=prev_stdout, stdout=stdout)
+            if prev_stdout is not None:
+                prev_stdout.close() # let SIGPIPE reach earlier commands if a later command exits
+            prev_stdout = proc.stdout
+            procs.append(proc)
+
+        failed_command = None
+        failed_exitcode = 0
+        for proc, command in zip(procs, commands):
+            exitcode = proc.wait()
+            if exitcode == -signal.SIGPIPE:
+                continue # expected when a downstream command stops reading early
+            if exitcode != 0 and failed_command is None:
+                failed_command = command
+                failed_exitcode = exitcode
+    finally:
+        if out is not None:
+            out.close()
+
+    if failed_command is not None:
+        raise subprocess.CalledProcessError(failed_exitcode, failed_command)
@@ -6,7 +6,9 @@ index file for subsequent pileups.
 from __future__ import print_function
 from __future__ import absolute_import
 
+import glob
 import os
+import shutil
 import sys
 
 from snppipeline import command
@@ -14,6 +16,119 @@ from snppipeline import utils
 from snppipeline.utils import verbose_print
 
 
+def reference_index_cache_dir(fasta_hash, stage):
+    """Return the content-addressed cache directory for one indexing stage.
+
+    Parameters
+    ----------
+    fasta_hash : str
+        SHA-256 hex digest of the reference fasta file contents.
+    stage : str
+        Name of the indexing stage, e.g. "bowtie2" or "faidx".
+
+    Returns
+    -------
+    cache_dir : str
+        Path to the cache directory for this reference and stage.
+    """
+    cache_root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_root, "cfsan_snp_pipeline", fasta_hash, stage)
+
+
+def restore_cached_index_files(cache_dir, version_str, target_dir):
+    """Symlink previously built index files from the cache into the reference directory.
+
+    The cache directory holds a manifest file listing the tool version string
+    and the names of the cached index files.  The cache is only usable when
+    the manifest version matches the currently installed tool version.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Path to the cache directory for this reference and stage.
+    version_str : str
+        Version string of the tool that builds the index files.
+    target_dir : str
+        Path to the directory containing the reference fasta file.
+
+    Returns
+    -------
+    restored : bool
+        True if the cache held a usable set of index files, False otherwise.
+    """
+    manifest_file = os.path.join(cache_dir, "manifest")
+    if not os.path.isfile(manifest_file):
+        return False
+    with open(manifest_file) as f:
+        cached_version = f.readline().rstrip('\n')
+        cached_file_names = [line.rstrip('\n') for line in f]
+    if cached_version != version_str or not cached_file_names:
+        return False
+    if not all(os.path.isfile(os.path.join(cache_dir, name)) for name in cached_file_names):
+        return False
+    for name in cached_file_names:
+        link_path = os.path.join(target_dir, name)
+        utils.remove_file(link_path)
+        os.symlink(os.path.join(cache_dir, name), link_path)
+    return True
+
+
+def unlink_symlinked_index_files(file_paths):
+    """Remove index files that are symlinks left behind by a cache restore.
+
+    This must be called before rebuilding index files.  After a previous
+    restore, the index files in the reference directory are symlinks into the
+    cache; rebuilding through those links would overwrite the shared cache
+    entry in place, corrupting it for every other working directory linked to
+    the same entry.  Removing the links first makes the build tools write
+    ordinary files.
+
+    Parameters
+    ----------
+    file_paths : list of str
+        Paths to index files which may be symlinks from a previous restore.
+    """
+    for file_path in file_paths:
+        if os.path.islink(file_path):
+            os.unlink(file_path)
+
+
+def store_index_files_in_cache(cache_dir, version_str, built_files):
+    """Move freshly built index files into the cache and symlink them back into place.
+
+    The manifest file is written last, so an interrupted store leaves an
+    unusable cache entry rather than a partial one.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Path to the cache directory for this reference and stage.
+    version_str : str
+        Version string of the tool that built the index files.
+    built_files : list of str
+        Paths to the freshly built index files.
+    """
+    utils.mkdir_p(cache_dir)
+    file_names = []
+    for built_file in built_files:
+        name = os.path.basename(built_file)
+        cached_file = os.path.join(cache_dir, name)
+        if os.path.realpath(built_file) == os.path.realpath(cached_file):
+            # A symlink from a previous restore already points at the cache
+            # entry, so the built data is already in place -- moving the link
+            # onto its own target would destroy it
+            file_names.append(name)
+            continue
+        utils.remove_file(cached_file)
+        shutil.move(built_file, cached_file)
+        os.symlink(cached_file, built_file)
+        file_names.append(name)
+    with open(os.path.join(cache_dir, "manifest"), "w") as f:
+        print(version_str, file=f)
+        for name in file_names:
+            print(name, file=f)
+
+
 def index_ref(args):
     """Index the reference genome.
 
@@ -54,6 +169,11 @@ def index_ref(args):
     utils.verify_non_empty_input_files("Reference file", [reference_file_path], error_handler="global")
 
     reference_base_path = os.path.splitext(reference_file_path)[0] # strip the file extension
+    reference_dir = os.path.dirname(os.path.abspath(reference_file_path))
+
+    # The content hash of the reference identifies previously built indexes in the cache,
+    # allowing reuse of index files across working directories
+    fasta_hash = utils.sha256_file(reference_file_path)
 
     # The environment variable SnpPipeline_Aligner selects between bowtie2 and smalt
     snp_pipeline_aligner = os.environ.get("SnpPipeline_Aligner") or "bowtie2"
@@ -69,12 +189,19 @@ def index_ref(args):
             verbose_print("# Bowtie index %s is already freshly built.  Use the -f option to force a rebuild." % target_file)
         else:
             version_str = utils.extract_version_str("bowtie2", "bowtie2 --version")
-            bowtie2_build_extra_params = os.environ.get("Bowtie2Build_ExtraParams") or ""
-            command_line = "bowtie2-build " + bowtie2_build_extra_params + ' ' + reference_file_path + ' ' + reference_base_path
-            verbose_print("# %s %s" % (utils.timestamp(), command_line))
-            verbose_print("# %s" % version_str)
-            command.run(command_line, sys.stdout)
-            utils.global_error_on_missing_file(target_file, "bowtie2-build")
+            cache_dir = reference_index_cache_dir(fasta_hash, "bowtie2")
+            if not args.forceFlag and restore_cached_index_files(cache_dir, version_str, reference_dir):
+                verbose_print("# Bowtie index %s restored from cache %s" % (target_file, cache_dir))
+            else:
+                bowtie2_build_extra_params = os.environ.get("Bowtie2Build_ExtraParams") or ""
+                unlink_symlinked_index_files(glob.glob(reference_base_path + ".*.bt2") + glob.glob(reference_base_path + ".*.bt2l"))
+                command_line = "bowtie2-build " + bowtie2_build_extra_params + ' ' + reference_file_path + ' ' + reference_base_path
+                verbose_print("# %s %s" % (utils.timestamp(), command_line))
+                verbose_print("# %s" % version_str)
+                command.run(command_line, sys.stdout)
+                utils.global_error_on_missing_file(target_file, "bowtie2-build")
+                built_files = glob.glob(reference_base_path + ".*.bt2") + glob.glob(reference_base_path + ".*.bt2l")
+                store_index_files_in_cache(cache_dir, version_str, built_files)
 
     elif snp_pipeline_aligner == "smalt":
         target_file = reference_base_path + ".smi"
@@ -83,11 +210,19 @@ def index_ref(args):
             verbose_print("# Smalt index %s is already freshly built.  Use the -f option to force a rebuild." % target_file)
         else:
             version_str = utils.extract_version_str("smalt", "smalt version")
-            smalt_index_extra_params = os.environ.get("SmaltIndex_ExtraParams") or ""
-            command_line = "smalt index " + smalt_index_extra_params + ' ' + reference_base_path + ' ' + reference_file_path
-            verbose_print("# %s %s" % (utils.timestamp(), command_line))
-            verbose_print("# %s" % version_str)
-            command.run(command_line, sys.stdout)
+            cache_dir = reference_index_cache_dir(fasta_hash, "smalt")
+            if not args.forceFlag and restore_cached_index_files(cache_dir, version_str, reference_dir):
+                verbose_print("# Smalt index %s restored from cache %s" % (target_file, cache_dir))
+            else:
+                smalt_index_extra_params = os.environ.get("SmaltIndex_ExtraParams") or ""
+                unlink_symlinked_index_files([reference_base_path + ".smi", reference_base_path + ".sma"])
+                command_line = "smalt index " + smalt_index_extra_params + ' ' + reference_base_path + ' ' + reference_file_path
+                verbose_print("# %s %s" % (utils.timestamp(), command_line))
+                verbose_print("# %s" % version_str)
+                command.run(command_line, sys.stdout)
+                built_files = [f for f in [reference_base_path + ".smi", reference_base_path + ".sma"] if os.path.isfile(f)]
+                if built_files:
+                    store_index_files_in_cache(cache_dir, version_str, built_files)
 
     # Create the samtools fai index
     verbose_print("")
@@ -97,12 +232,18 @@ def index_ref(args):
         verbose_print("# SAMtools fai index %s is already freshly built.  Use the -f option to force a rebuild." % target_file)
     else:
         version_str = utils.extract_version_str("samtools", "samtools 2>&1 > /dev/null")
-        samtools_faidx_extra_params = os.environ.get("SamtoolsFaidx_ExtraParams") or ""
-        command_line = "samtools faidx " + samtools_faidx_extra_params + ' ' + reference_file_path
-        verbose_print("# %s %s" % (utils.timestamp(), command_line))
-        verbose_print("# %s" % version_str)
-        command.run(command_line, sys.stdout)
-        utils.global_error_on_missing_file(target_file, "samtools faidx")
+        cache_dir = reference_index_cache_dir(fasta_hash, "faidx")
+        if not args.forceFlag and restore_cached_index_files(cache_dir, version_str, reference_dir):
+            verbose_print("# SAMtools fai index %s restored from cache %s" % (target_file, cache_dir))
+        else:
+            samtools_faidx_extra_params = os.environ.get("SamtoolsFaidx_ExtraParams") or ""
+            unlink_symlinked_index_files([target_file])
+            command_line = "samtools faidx " + samtools_faidx_extra_params + ' ' + reference_file_path
+            verbose_print("# %s %s" % (utils.timestamp(), command_line))
+            verbose_print("# %s" % version_str)
+            command.run(command_line, sys.stdout)
+            utils.global_error_on_missing_file(target_file, "samtools faidx")
+            store_index_files_in_cache(cache_dir, version_str, [target_file])
 
     # Create the reference dict file used later by GATK
     enable_local_realignment = os.environ.get("EnableLocalRealignment", "true").lower() == "true"
@@ -118,13 +259,19 @@ def index_ref(args):
             if not jar_file_path:
                 utils.global_error("Error: cannot execute Picard. Define the path to picard.jar in the CLASSPATH environment variable.")
             version_str = utils.extract_version_str("Picard", "java -jar " + jar_file_path + " CreateSequenceDictionary --version 2>&1")
-            picard_jvm_extra_params = os.environ.get("PicardJvm_ExtraParams") or ""
-            picard_create_sequence_dictionary_extra_params = os.environ.get("CreateSequenceDictionary_ExtraParams") or ""
-            tmpdir = os.environ.get("TMPDIR") or os.environ.get("TMP_DIR")
-            tmp_option = " TMP_DIR=" + tmpdir if tmpdir else ""
-            command_line = "java " + picard_jvm_extra_params + " -jar " + jar_file_path + " CreateSequenceDictionary REFERENCE=" + reference_file_path + " OUTPUT=" + target_file + tmp_option + ' ' + picard_create_sequence_dictionary_extra_params
-            verbose_print("# Create reference sequence dictionary.")
-            verbose_print("# %s %s" % (utils.timestamp(), command_line))
-            verbose_print("# %s" % version_str)
-            command.run(command_line, sys.stdout)
-            utils.sample_error_on_missing_file(target_file, "picard CreateSequenceDictionary")
+            cache_dir = reference_index_cache_dir(fasta_hash, "dict")
+            if not args.forceFlag and restore_cached_index_files(cache_dir, version_str, reference_dir):
+                verbose_print("# Sequence dictionary %s restored from cache %s" % (target_file, cache_dir))
+            else:
+                picard_jvm_extra_params = os.environ.get("PicardJvm_ExtraParams") or ""
+                picard_create_sequence_dictionary_extra_params = os.environ.get("CreateSequenceDictionary_ExtraParams") or ""
+                tmpdir = os.environ.get("TMPDIR") or os.environ.get("TMP_DIR")
+                tmp_option = " TMP_DIR=" + tmpdir if tmpdir else ""
+                command_line = "java " + picard_jvm_extra_params + " -jar " + jar_file_path + " CreateSequenceDictionary REFERENCE=" + reference_file_path + " OUTPUT=" + target_file + tmp_option + ' ' + picard_create_sequence_dictionary_extra_params
+                verbose_print("# Create reference sequence dictionary.")
+                verbose_print("# %s %s" % (utils.timestamp(), command_line))
+                verbose_print("# %s" % version_str)
+                command.run(command_line, sys.stdout)
+                utils.sample_error_on_missing_file(target_file, "picard CreateSequenceDictionary")
+                if os.path.isfile(target_file):
+                    store_index_files_in_cache(cache_dir, version_str, [target_file])
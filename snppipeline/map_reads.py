@@ -7,6 +7,7 @@ Read group tags are also assigned during this step.
 from __future__ import print_function
 from __future__ import absolute_import
 
+import argparse
 import os
 from packaging import version as packaging_version
 import re
@@ -19,6 +20,42 @@ from snppipeline import utils
 from snppipeline.utils import verbose_print
 
 
+def map_reads_batch(args):
+    """Align reads to the reference for all samples in a single invocation.
+
+    Loop over all the sample directories listed in the sample directories file,
+    aligning each sample in turn within this single process.  Aligning all the
+    samples back-to-back keeps the reference index resident in the operating
+    system page cache between samples, so the aligner does not re-read the
+    index from disk for every sample.  This is most noticeable on short
+    datasets where the index load time dominates the alignment time.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        referenceFile : File path of the reference fasta file
+        sampleDirsFile : Path to file containing a list of directories -- one per sample
+    """
+    sample_directories_list_path = args.sampleDirsFile
+    utils.verify_non_empty_input_files("File of sample directories", [sample_directories_list_path], error_handler="global")
+
+    with open(sample_directories_list_path, "r") as f:
+        sample_directories = [line.rstrip() for line in f]
+    sample_directories = [d for d in sample_directories if d]
+
+    for sample_dir in sample_directories:
+        fastq_files = fastq.list_fastq_files(sample_dir)
+        if not fastq_files:
+            utils.sample_warning("Sample directory %s does not contain any fastq files." % sample_dir)
+            continue
+
+        # Align one sample with the same options as a single-sample invocation
+        sample_args = argparse.Namespace(**vars(args))
+        sample_args.sampleFastqFile1 = fastq_files[0]
+        sample_args.sampleFastqFile2 = fastq_files[1] if len(fastq_files) > 1 else None
+        map_reads(sample_args)
+
+
 def map_reads(args):
     """Align reads to the reference.
 
@@ -69,6 +106,15 @@ def map_reads(args):
     reference_file_path = args.referenceFile
     utils.verify_non_empty_input_files("Reference file", [reference_file_path], error_handler="global")
 
+    # Optionally read the reference and its indexes from a shared memory copy,
+    # avoiding repeated reads from network storage when mapping many samples
+    cache_reference_in_shm = os.environ.get("CacheReferenceInShm", "false").lower() == "true"
+    if cache_reference_in_shm:
+        shm_reference_path = utils.stage_to_shm(reference_file_path)
+        if shm_reference_path != reference_file_path:
+            verbose_print("# Reading reference from shared memory copy %s" % shm_reference_path)
+            reference_file_path = shm_reference_path
+
     # Verify fastq files exist and are not empty
     sample_fastq_file1 = args.sampleFastqFile1
     sample_fastq_file2 = args.sampleFastqFile2
@@ -124,7 +170,11 @@ def map_reads(args):
         source_files.append(reference_base_path + ".rev.1.bt2")
     elif snp_pipeline_aligner == "smalt":
         source_files.append(reference_base_path + ".smi")
-    needs_rebuild = utils.target_needs_rebuild(source_files, sam_file)
+    # Compare content hashes to the manifest from the prior alignment when one
+    # exists -- mtimes lie when workspaces are copied between hosts
+    manifest_file = os.path.join(sample_dir, ".cfsan.manifest")
+    source_manifest = utils.compute_manifest(source_files)
+    needs_rebuild = utils.target_needs_rebuild_manifest(source_manifest, sam_file, manifest_file, "map_reads")
 
     if not args.forceFlag and not needs_rebuild:
         verbose_print("# %s has already been aligned to %s.  Use the -f option to force a rebuild." % (sample_id, reference_id))
@@ -221,54 +271,77 @@ def map_reads(args):
             verbose_print("# %s %s" % (utils.timestamp(), command_line))
             verbose_print("# %s" % picard_version_str)
             command.run(command_line, sys.stdout)
+        utils.write_manifest(manifest_file, "map_reads", source_manifest)
         verbose_print("")
 
     #==========================================================================
-    # Convert sam to bam file, selecting only the mapped reads
+    # Convert sam to bam file, selecting only the mapped reads, and sort the
+    # bam file.  When both results are stale, the two steps run as a single
+    # piped pass -- the sorter reads the filtered bam from the pipe while tee
+    # saves it, so the intermediate bam file is written once and never re-read.
     #==========================================================================
 
-    # Check for fresh bam file; if not, convert to bam file with only mapped reads
     unsorted_bam_file = os.path.join(sample_dir, "reads.unsorted.bam")
-    needs_rebuild = utils.target_needs_rebuild([sam_file], unsorted_bam_file)
-    if not args.forceFlag and not needs_rebuild:
-        verbose_print("# Unsorted bam file is already freshly created for %s.  Use the -f option to force a rebuild." % sample_id)
-    else:
+    sorted_bam_file = os.path.join(sample_dir, "reads.sorted.bam")
+    bam_needs_rebuild = utils.target_needs_rebuild([sam_file], unsorted_bam_file)
+    sort_needs_rebuild = utils.target_needs_rebuild([unsorted_bam_file], sorted_bam_file)
+
+    if args.forceFlag or (bam_needs_rebuild and sort_needs_rebuild):
         # Substitute the default parameters if the user did not specify samtools view parameters
         os.environ["SamtoolsSamFilter_ExtraParams"] = os.environ.get("SamtoolsSamFilter_ExtraParams") or "-F 4"
 
         # Set the number of threads to use
         utils.configure_process_threads("SamtoolsSamFilter_ExtraParams", ["-@", "--threads"], num_threads, None)
         samtools_samfilter_params = os.environ["SamtoolsSamFilter_ExtraParams"]
+        utils.configure_process_threads("SamtoolsSort_ExtraParams", ["-@", "--threads"], num_threads, None)
+        samtools_sort_extra_params = os.environ["SamtoolsSort_ExtraParams"]
 
-        command_line = "samtools view -S -b " + samtools_samfilter_params + " -o " + unsorted_bam_file + ' ' + sam_file
-        verbose_print("# Convert sam file to bam file with only mapped positions.")
-        verbose_print("# %s %s" % (utils.timestamp(), command_line))
+        view_command = "samtools view -S -b " + samtools_samfilter_params + ' ' + sam_file
+        tee_command = "tee " + unsorted_bam_file
+        sort_command = "samtools sort " + samtools_sort_extra_params + " -o " + sorted_bam_file
+        verbose_print("# Convert sam file to bam file with only mapped positions and sort the bam file.")
+        verbose_print("# %s %s" % (utils.timestamp(), view_command + " | " + tee_command + " | " + sort_command))
         verbose_print("# %s" % samtools_version_str)
-        command.run(command_line, sys.stdout)
+        command.run_pipeline([view_command, tee_command, sort_command], sys.stdout)
         utils.sample_error_on_missing_file(unsorted_bam_file, "samtools view")
+        utils.sample_error_on_missing_file(sorted_bam_file, "samtools sort")
         verbose_print("")
+    else:
+        # Check for fresh bam file; if not, convert to bam file with only mapped reads
+        if not bam_needs_rebuild:
+            verbose_print("# Unsorted bam file is already freshly created for %s.  Use the -f option to force a rebuild." % sample_id)
+        else:
+            # Substitute the default parameters if the user did not specify samtools view parameters
+            os.environ["SamtoolsSamFilter_ExtraParams"] = os.environ.get("SamtoolsSamFilter_ExtraParams") or "-F 4"
 
-    #==========================================================================
-    # Sort the BAM file
-    #==========================================================================
+            # Set the number of threads to use
+            utils.configure_process_threads("SamtoolsSamFilter_ExtraParams", ["-@", "--threads"], num_threads, None)
+            samtools_samfilter_params = os.environ["SamtoolsSamFilter_ExtraParams"]
 
-    # Check for fresh sorted bam file; if not, sort it
-    sorted_bam_file = os.path.join(sample_dir, "reads.sorted.bam")
-    needs_rebuild = utils.target_needs_rebuild([unsorted_bam_file], sorted_bam_file)
-    if not args.forceFlag and not needs_rebuild:
-        verbose_print("# Sorted bam file is already freshly created for %s.  Use the -f option to force a rebuild." % sample_id)
-    else:
-        # Set the number of threads to use
-        utils.configure_process_threads("SamtoolsSort_ExtraParams", ["-@", "--threads"], num_threads, None)
-        samtools_sort_extra_params = os.environ["SamtoolsSort_ExtraParams"]
+            command_line = "samtools view -S -b " + samtools_samfilter_params + " -o " + unsorted_bam_file + ' ' + sam_file
+            verbose_print("# Convert sam file to bam file with only mapped positions.")
+            verbose_print("# %s %s" % (utils.timestamp(), command_line))
+            verbose_print("# %s" % samtools_version_str)
+            command.run(command_line, sys.stdout)
+            utils.sample_error_on_missing_file(unsorted_bam_file, "samtools view")
+            verbose_print("")
 
-        command_line = "samtools sort " + samtools_sort_extra_params + " -o " + sorted_bam_file + ' ' + unsorted_bam_file
-        verbose_print("# Convert bam to sorted bam file.")
-        verbose_print("# %s %s" % (utils.timestamp(), command_line))
-        verbose_print("# %s" % samtools_version_str)
-        command.run(command_line, sys.stdout)
-        utils.sample_error_on_missing_file(sorted_bam_file, "samtools sort")
-        verbose_print("")
+        # Check for fresh sorted bam file; if not, sort it
+        needs_rebuild = utils.target_needs_rebuild([unsorted_bam_file], sorted_bam_file)
+        if not needs_rebuild:
+            verbose_print("# Sorted bam file is already freshly created for %s.  Use the -f option to force a rebuild." % sample_id)
+        else:
+            # Set the number of threads to use
+            utils.configure_process_threads("SamtoolsSort_ExtraParams", ["-@", "--threads"], num_threads, None)
+            samtools_sort_extra_params = os.environ["SamtoolsSort_ExtraParams"]
+
+            command_line = "samtools sort " + samtools_sort_extra_params + " -o " + sorted_bam_file + ' ' + unsorted_bam_file
+            verbose_print("# Convert bam to sorted bam file.")
+            verbose_print("# %s %s" % (utils.timestamp(), command_line))
+            verbose_print("# %s" % samtools_version_str)
+            command.run(command_line, sys.stdout)
+            utils.sample_error_on_missing_file(sorted_bam_file, "samtools sort")
+            verbose_print("")
 
     #==========================================================================
     # Mark duplicate reads, so they will be ignored in subsequent steps
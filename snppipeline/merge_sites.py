@@ -98,7 +98,7 @@ def merge_sites(args):
             if os.path.getsize(vcf_file_path) == 0:
                 continue
 
-            utils.verbose_print("Processing VCF file %s" % vcf_file_path)
+            utils.vprint(1, lambda: "Processing VCF file %s" % vcf_file_path)
             sample_name = os.path.basename(os.path.dirname(vcf_file_path))
             snp_set = utils.convert_vcf_file_to_snp_set(vcf_file_path)
             max_snps = args.maxSnps
@@ -11,11 +11,56 @@ import shutil
 import sys
 import tempfile
 
+from concurrent import futures
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
 from snppipeline import command
 from snppipeline import utils
 from snppipeline.utils import verbose_print
 
 
+def prepare_sample_vcf(src_file, dst_file, threads=1):
+    """Copy, compress, and index a single sample VCF file.
+
+    This function processes one sample and is intended to run either serially
+    or in a pool of worker processes.
+
+    When the pysam package is installed, the compression and indexing run
+    in-process through the htslib C library, avoiding two subprocess launches
+    per sample.  Otherwise the external bgzip and tabix programs are used.
+
+    Parameters
+    ----------
+    src_file : str
+        Path to the sample VCF file.
+    dst_file : str
+        Path to the VCF file copy which will be compressed and indexed.
+    threads : int, optional defaults to 1
+        Number of BGZF compression threads.  Only honored by the external
+        bgzip program.
+    """
+    verbose_print("copy %s %s" % (src_file, dst_file))
+    utils.fast_copy(src_file, dst_file)
+
+    gz_file = dst_file + ".gz"
+    if pysam is not None:
+        verbose_print("bgzip %s > %s (pysam)" % (dst_file, gz_file))
+        pysam.tabix_compress(dst_file, gz_file, force=True)
+        verbose_print("tabix -f -p vcf %s (pysam)" % gz_file)
+        pysam.tabix_index(gz_file, preset="vcf", force=True)
+    else:
+        threads_option = " -@ " + str(threads) if threads > 1 else ""
+        verbose_print("bgzip%s -c %s > %s" % (threads_option, dst_file, gz_file))
+        command.run("bgzip" + threads_option + " -c " + dst_file, gz_file)
+
+        verbose_print("tabix -f -p vcf " + gz_file)
+        command.run("tabix -f -p vcf " + gz_file, sys.stdout)
+
+
 def merge_vcfs(args):
     """Merge the per-sample VCF files.
 
@@ -57,12 +102,19 @@ def merge_vcfs(args):
     with open(sample_directories_list_path, "r") as f:
         sample_directories = [line.rstrip() for line in f]
     sample_directories = [d for d in sample_directories if d]
-    vcf_files = [os.path.join(d, vcf_file_name) for d in sample_directories]
+
+    # Scan each sample directory once and cache the stat results, so the
+    # existence, size, and timestamp checks below issue no extra syscalls
+    vcf_files, vcf_file_stats = utils.collect_sample_files(sample_directories, vcf_file_name)
 
     good_vcf_files = []
     for vcf_file in vcf_files:
-        bad = utils.verify_non_empty_input_files("Sample vcf file", [vcf_file], error_handler="sample", continue_possible=True)
-        if not bad:
+        vcf_file_stat = vcf_file_stats.get(vcf_file)
+        if vcf_file_stat is None:
+            utils.sample_error("Sample vcf file %s does not exist." % vcf_file, continue_possible=True)
+        elif vcf_file_stat.st_size == 0:
+            utils.sample_error("Sample vcf file %s is empty." % vcf_file, continue_possible=True)
+        else:
             good_vcf_files.append(vcf_file)
 
     num_vcf_files = len(good_vcf_files)
@@ -72,7 +124,7 @@ def merge_vcfs(args):
     #==========================================================================
     # Check if merge has already been done
     #==========================================================================
-    needs_rebuild = utils.target_needs_rebuild(vcf_files, merged_vcf_file)
+    needs_rebuild = utils.target_needs_rebuild_stats(vcf_file_stats.values(), merged_vcf_file)
     if not args.forceFlag and not needs_rebuild:
         verbose_print("# Multi-VCF file is already freshly created.  Use the -f option to force a rebuild.")
         return
@@ -95,43 +147,48 @@ def merge_vcfs(args):
 
     # If there is only one good sample, just copy the consensus VCF file to the snpma.vcf file
     if len(good_vcf_files) == 1:
-        shutil.copy(good_vcf_files[0], merged_vcf_file)
+        utils.fast_copy(good_vcf_files[0], merged_vcf_file)
         return
 
     # Copy single VCF files to a common directory where the files will be edited
-    verbose_print("# %s Copying VCF files to temp directory" % utils.timestamp())
+    verbose_print("# %s Copying, compressing, and indexing VCF files" % utils.timestamp())
     parent_of_temp_dir = os.path.dirname(merged_vcf_file)
     temp_dir = tempfile.mkdtemp(prefix="tmp.vcf.", dir=parent_of_temp_dir)
-    file_copies = []
+    src_files = []
+    dst_files = []
     for d in sample_directories:
         src_file = os.path.join(d, vcf_file_name)
         if src_file in good_vcf_files:
-            dst_file = os.path.join(temp_dir, os.path.basename(d) + ".vcf")
-            file_copies.append(dst_file)
-            verbose_print("copy %s %s" % (src_file, dst_file))
-            #if not os.path.isfile(dst_file) or os.stat(src_file).st_mtime > os.stat(dst_file).st_mtime:
-            shutil.copy2(src_file, dst_file)
-
-    # bgzip all the sample vcf files
-    verbose_print("# %s Compressing VCF files" % utils.timestamp())
-    for file in file_copies:
-        verbose_print("bgzip -c %s > %s" % (file, file + ".gz"))
-        command.run("bgzip -c " + file, file + ".gz")
-
-    # Index all the zipped sample vcf file
-    verbose_print("# %s Indexing VCF files" % utils.timestamp())
-    for file in file_copies:
-        file += ".gz"
-        verbose_print("tabix -f -p vcf " + file)
-        command.run("tabix -f -p vcf " + file, sys.stdout)
+            src_files.append(src_file)
+            dst_files.append(os.path.join(temp_dir, os.path.basename(d) + ".vcf"))
+
+    # Schedule the largest samples first to keep the pool of workers busy
+    num_jobs = args.jobs or 1
+    permutation = utils.schedule_by_size([vcf_file_stats[f].st_size for f in src_files])
+    src_files = [src_files[i] for i in permutation]
+    dst_files = [dst_files[i] for i in permutation]
+
+    # Split the compression threads across the pool workers so the two levels
+    # of parallelism do not oversubscribe the CPU
+    num_threads = args.threads or 1
+    threads_per_sample = max(1, num_threads // num_jobs)
+
+    # Copy, compress, and index the sample VCF files -- in parallel when possible
+    if num_jobs > 1:
+        with futures.ProcessPoolExecutor(max_workers=num_jobs) as executor:
+            list(executor.map(prepare_sample_vcf, src_files, dst_files, [threads_per_sample] * len(src_files)))
+    else:
+        for src_file, dst_file in zip(src_files, dst_files):
+            prepare_sample_vcf(src_file, dst_file, threads_per_sample)
 
     # Substitute the default parameters if the user did not specify bcftools parameters
     default_params = "--merge all --info-rules NS:sum"
     bcf_tools_extra_params = os.environ.get("BcftoolsMerge_ExtraParams") or default_params
 
-    # Merge the VCFs
+    # Merge the VCFs.  The merge loop runs entirely inside bcftools (htslib),
+    # with extra worker threads handling the BGZF compression of the inputs.
     verbose_print("# %s Merging VCF files" % utils.timestamp())
-    command_line = "bcftools merge -o " + merged_vcf_file + ' ' + bcf_tools_extra_params + ' ' + temp_dir + "/*.gz"
+    command_line = "bcftools merge --threads " + str(num_threads) + " -o " + merged_vcf_file + ' ' + bcf_tools_extra_params + ' ' + temp_dir + "/*.gz"
     verbose_print(command_line)
     command.run(command_line, sys.stdout)
 
@@ -251,12 +251,33 @@ class Record(object):
 
         self.good_depth = len(bases_list)
 
-        # Substitute reference bases markers with letter
-        bases_str = bases_str.replace('.', self.reference_base.upper())
-        bases_str = bases_str.replace(',', self.reference_base.lower())
+        # Count the bases in a single pass.  The combined and per-strand
+        # counters are derived from the handful of distinct base characters
+        # instead of re-scanning the whole base string once per counter.
+        base_counts = Counter(bases_str)
+
+        # Substitute reference base markers with the reference letter
+        if '.' in base_counts:
+            base_counts[self.reference_base.upper()] += base_counts.pop('.')
+        if ',' in base_counts:
+            base_counts[self.reference_base.lower()] += base_counts.pop(',')
+
+        # Get counts of bases on each strand -- lowercase bases are reads on
+        # the reverse strand
+        forward_counts = Counter()
+        reverse_counts = Counter()
+        for base, count in base_counts.items():
+            if base >= 'a':
+                reverse_counts[base.upper()] += count
+            else:
+                forward_counts[base] += count
+        self.forward_base_good_depth = forward_counts
+        self.reverse_base_good_depth = reverse_counts
+        self.forward_good_depth = sum(forward_counts.values())
+        self.reverse_good_depth = sum(reverse_counts.values())
 
         # Get counts of bases regardless of strand
-        self.base_good_depth = Counter(bases_str.upper())
+        self.base_good_depth = forward_counts + reverse_counts
         if self.good_depth < 1:
             self.most_common_good_bases = None
         else:
@@ -265,14 +286,6 @@ class Record(object):
             bases_freq_list = sorted(bases_freq_list, key=lambda tup: (-tup[1], tup[0]))
             self.most_common_good_bases = [base for base, freq in bases_freq_list]
 
-        # Get counts of bases on each strand
-        forward_bases_str = ''.join([c for c in bases_str if c <= 'Z'])
-        reverse_bases_str = ''.join([c for c in bases_str if c >= 'a'])
-        self.forward_good_depth = len(forward_bases_str)
-        self.reverse_good_depth = len(reverse_bases_str)
-        self.forward_base_good_depth = Counter(forward_bases_str)
-        self.reverse_base_good_depth = Counter(reverse_bases_str.upper())
-
     @staticmethod # Doesn't use self
     def _strip_unwanted_base_patterns(bases_str):
         """
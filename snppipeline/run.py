@@ -11,7 +11,6 @@ from jobrunner import JobRunner
 from jobrunner import JobRunnerException
 import os
 from packaging import version as packaging_version
-import psutil
 import shutil
 import subprocess
 import sys
@@ -396,7 +395,7 @@ def run(args):
             utils.fatal_error("Config file error in MaxCpuCores parameter: %s is not a valid number." % max_cpu_cores)
 
     if job_queue_mgr is None: # workstation
-        num_local_cpu_cores = psutil.cpu_count()
+        num_local_cpu_cores = utils.logical_cpu_count()
         max_cpu_cores = min(num_local_cpu_cores, max_cpu_cores) if max_cpu_cores else num_local_cpu_cores
 
     # How many CPU cores per process?
@@ -437,6 +436,7 @@ def run(args):
     os.environ["PicardJvm_ExtraParams"] = config_params.get("PicardJvm_ExtraParams", "")
     os.environ["PicardMarkDuplicates_ExtraParams"] = config_params.get("PicardMarkDuplicates_ExtraParams", "")
     os.environ["EnableLocalRealignment"] = config_params.get("EnableLocalRealignment", "").lower() or "true"
+    os.environ["CacheReferenceInShm"] = config_params.get("CacheReferenceInShm", "").lower() or "false"
     os.environ["GatkJvm_ExtraParams"] = config_params.get("GatkJvm_ExtraParams", "")
     os.environ["RealignerTargetCreator_ExtraParams"] = config_params.get("RealignerTargetCreator_ExtraParams", "")
     os.environ["IndelRealigner_ExtraParams"] = config_params.get("IndelRealigner_ExtraParams", "")
@@ -1,25 +1,32 @@
 from __future__ import print_function
 from __future__ import absolute_import
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
 
 try:
     from collections import OrderedDict
 except ImportError:
     from ordereddict import OrderedDict
 
+import atexit
+import bisect
+import datetime
 import errno
+import hashlib
+import io
+import json
 import locale
+import mmap
 import os
 import platform
-import psutil
 import re
+import shutil
+import stat as stat_module
 import sys
 import subprocess
 import time
 import traceback
-import vcf
+
+# Slow imports (Bio, vcf, pysam) are deferred into the functions that need
+# them, so commands that do not touch fasta or vcf files start faster
 
 from snppipeline.__init__ import __version__
 from snppipeline import command
@@ -53,33 +60,157 @@ def verbose_print(*args):
         print(*args)
 
 
+def vprint(level, message_function):
+    """Print a lazily formatted message conditionally depending on the configured verbosity.
+
+    The message is built by calling message_function, so the string formatting
+    cost is only paid when the verbosity is at or above the requested level.
+    Use this instead of verbose_print at call sites inside hot loops.
+
+    Parameters
+    ----------
+    level : int
+        Minimum verbosity level at which the message is printed.
+    message_function : callable
+        Function taking no arguments and returning the message string.
+
+    Examples
+    --------
+    >>> import argparse
+    >>> saved_verbosity = log_verbosity
+    >>> set_logging_verbosity(argparse.Namespace(verbose=1))
+    >>> vprint(1, lambda: "shown %d" % 42)
+    shown 42
+    >>> vprint(2, lambda: "hidden %d" % 42)
+    >>> set_logging_verbosity(argparse.Namespace(verbose=saved_verbosity))
+    """
+    if log_verbosity >= level:
+        print(message_function())
+
+
+def memory_mbytes():
+    """Return the total physical memory size in megabytes.
+
+    Reads /proc/meminfo where available, avoiding the psutil import cost at
+    every subcommand launch.
+
+    Returns
+    -------
+    mbytes : int
+        Total physical memory in megabytes, or 0 when it cannot be determined.
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024 # the value is in KB
+    except EnvironmentError:
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().total // (1024 * 1024)
+    except ImportError:
+        return 0
+
+
+def logical_cpu_count():
+    """Return the number of logical CPUs.
+
+    Returns
+    -------
+    count : int
+        Number of logical CPUs, never less than 1.
+    """
+    try:
+        return os.cpu_count() or 1
+    except AttributeError: # python 2
+        import psutil
+        return psutil.cpu_count() or 1
+
+
+def physical_cpu_count():
+    """Return the number of physical CPU cores.
+
+    Reads /proc/cpuinfo where available, avoiding the psutil import cost at
+    every subcommand launch.  Falls back to psutil, then to the logical CPU
+    count.
+
+    Returns
+    -------
+    count : int
+        Number of physical CPU cores, never less than 1.
+    """
+    try:
+        cores = set()
+        with open("/proc/cpuinfo") as f:
+            physical_id = None
+            for line in f:
+                if line.startswith("physical id"):
+                    physical_id = line.split(":")[1].strip()
+                elif line.startswith("core id"):
+                    cores.add((physical_id, line.split(":")[1].strip()))
+        if cores:
+            return len(cores)
+    except EnvironmentError:
+        pass
+    try:
+        import psutil
+        return psutil.cpu_count(logical=False) or 1
+    except ImportError:
+        return logical_cpu_count()
+
+
 def timestamp():
     """Return a timestamp string."""
-    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+    try:
+        # C-level formatter, avoids re-parsing the format string per call
+        return datetime.datetime.now().isoformat(sep=' ', timespec='seconds')
+    except TypeError: # python older than 3.6
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
 
 
+_program_name = None
+
 def program_name():
     """Return the basename of the python script being executed."""
-    return os.path.basename(sys.argv[0])
+    global _program_name
+    if _program_name is None:
+        _program_name = os.path.basename(sys.argv[0])
+    return _program_name
+
 
+_program_name_with_command = None
 
 def program_name_with_command():
     """Return the basename of the python script being executed with the
     subcommand if possible."""
-    program = os.path.basename(sys.argv[0])
-    if program == "cfsan_snp_pipeline":
-        program += " " + sys.argv[1]
-    return program
+    global _program_name_with_command
+    if _program_name_with_command is None:
+        program = program_name()
+        if program == "cfsan_snp_pipeline":
+            program += " " + sys.argv[1]
+        _program_name_with_command = program
+    return _program_name_with_command
+
 
+_command_line_short = None
 
 def command_line_short():
     """Return the command line string without the full path to the program."""
-    return "%s %s" % (program_name(), " ".join(sys.argv[1:]))
+    global _command_line_short
+    if _command_line_short is None:
+        _command_line_short = "%s %s" % (program_name(), " ".join(sys.argv[1:]))
+    return _command_line_short
 
 
+_command_line_long = None
+
 def command_line_long():
     """Return the command line string with the full path to the program."""
-    return " ".join(sys.argv)
+    global _command_line_long
+    if _command_line_long is None:
+        _command_line_long = " ".join(sys.argv)
+    return _command_line_long
 
 
 def print_log_header(classpath=False):
@@ -91,6 +222,9 @@ def print_log_header(classpath=False):
         When True, the Java CLASSPATH environment variable is logged.  This should be
         enabled when a script executes a Java program.
     """
+    if log_verbosity <= 0:
+        return # skip the hostname, memory, and locale lookups when nothing will be printed
+
     verbose_print("# Command           : %s" % command_line_long())
     verbose_print("# Working Directory : %s" % os.getcwd())
 
@@ -116,7 +250,7 @@ def print_log_header(classpath=False):
 
     verbose_print("# Hostname          : %s" % platform.node())
     locale.setlocale(locale.LC_ALL, '')
-    ram_mbytes = psutil.virtual_memory().total / 1024 / 1024
+    ram_mbytes = memory_mbytes()
     ram_str = locale.format("%d", ram_mbytes, grouping=True)
     verbose_print("# RAM               : %s MB" % ram_str)
     if classpath:
@@ -135,15 +269,50 @@ def print_arguments(args):
     args : argparse.Namespace
         Pre-parsed program arguments
     """
+    if log_verbosity <= 0:
+        return
+
+    skipped_options = frozenset(["subparser_name", "func", "excepthook"])
     verbose_print("Options:")
-    options_dict = vars(args)
-    for key in sorted(list(options_dict)):
-        if key in ["subparser_name", "func", "excepthook"]:
+    for key, value in sorted(vars(args).items()):
+        if key in skipped_options:
             continue
-        verbose_print("    %s=%s" % (key, options_dict[key]))
+        verbose_print("    %s=%s" % (key, value))
     verbose_print("")
 
 
+_compiled_regex_cache = {}
+
+def compiled_regex(pattern):
+    """Return a compiled regular expression, compiling each distinct pattern only once.
+
+    The re module keeps its own internal cache, but every call still pays the
+    pattern normalization and cache probe.  Caching the compiled object in a
+    plain dictionary makes repeated lookups a single dict access.
+
+    Parameters
+    ----------
+    pattern : str
+        Regular expression pattern.
+
+    Returns
+    -------
+    regex : compiled regular expression object
+
+    Examples
+    --------
+    >>> compiled_regex("[0-9]+").search("abc123").group(0)
+    '123'
+    >>> compiled_regex("[0-9]+") is compiled_regex("[0-9]+")
+    True
+    """
+    regex = _compiled_regex_cache.get(pattern)
+    if regex is None:
+        regex = re.compile(pattern)
+        _compiled_regex_cache[pattern] = regex
+    return regex
+
+
 def detect_numeric_option_in_parameters_str(parameters, option):
     """Parses a string of options to find a particular option followed by its
     value.
@@ -180,8 +349,7 @@ def detect_numeric_option_in_parameters_str(parameters, option):
     >>> detect_numeric_option_in_parameters_str("", "-p")
     False
     """
-    regex_str = option + "[ ]*([0-9])+"
-    regex = re.compile(regex_str)
+    regex = compiled_regex(re.escape(option) + "[ ]*[0-9]+")
     return regex.search(parameters) is not None
 
 
@@ -202,27 +370,19 @@ def extract_version_str(program_name, command_line):
         A version string of the form "program_name version 2.3.0" or
         "Unrecognized program_name version".
     """
-    # Run the command to get the version, split and clean the output
+    # Run the command to get the version somewhere in the output
     text = command.run(command_line)
-    lines = text.split('\n')
-    lines = [line.strip() for line in lines]
-    lines = [line for line in lines if line]
-
-    # Look for an output line with the word "version"
-    for line in lines:
-        lowerline = line.lower()
-        if "version" in lowerline:
-            lowerline = lowerline.replace(':', ' ')
-            tokens = lowerline.split()
-            for index, token in enumerate(tokens):
-                if token == "version" and len(tokens) > index + 1:
-                    return program_name + " version " + tokens[index + 1]
-
-    # if only one line and only one token, assume it is the version identifier
-    if len(lines) == 1:
-        tokens = lines[0].split()
-        if len(tokens) == 1:
-            return program_name + " version " + tokens[0]
+
+    # Look for the word "version" followed by the version identifier -- a
+    # single regex pass over the whole output instead of tokenizing each line
+    match = compiled_regex(r"(?im)(?:^|[\s:])version[:\s]+(\S+)").search(text)
+    if match:
+        return program_name + " version " + match.group(1).lower()
+
+    # if only one token in the output, assume it is the version identifier
+    tokens = text.split()
+    if len(tokens) == 1:
+        return program_name + " version " + tokens[0]
 
     return "Unrecognized " + program_name + " version"
 
@@ -320,6 +480,364 @@ def add_file_suffix(path, suffix, enable=True):
     return path
 
 
+def fast_copy(src_path, dst_path, bufsize=2 * 1024 * 1024):
+    """Copy a file using the kernel zero-copy path when available.
+
+    On platforms with os.sendfile, the bytes move from file to file inside
+    the kernel without passing through Python userspace buffers.  Elsewhere,
+    or when sendfile is not supported by the file system, the copy falls back
+    to shutil.copyfileobj with a large buffer.  The default buffer size is
+    2 MiB -- a multiple of the page size, large enough to keep fast storage
+    devices busy.
+
+    Parameters
+    ----------
+    src_path : str
+        Path to the source file.
+    dst_path : str
+        Path to the destination file, replaced if it already exists.
+    bufsize : int, optional defaults to 2 MiB
+        Number of bytes to move per system call.
+
+    Examples
+    --------
+    # Setup tests
+    >>> from tempfile import NamedTemporaryFile
+
+    # Create a file to copy
+    >>> f = NamedTemporaryFile(delete=False, mode='w')
+    >>> src_path = f.name
+    >>> num_bytes = f.write("Hello")
+    >>> f.close()
+
+    # Copy the file
+    >>> dst_path = src_path + ".copy"
+    >>> fast_copy(src_path, dst_path)
+    >>> open(dst_path).read()
+    'Hello'
+    >>> os.unlink(src_path)
+    >>> os.unlink(dst_path)
+    """
+    if hasattr(os, "sendfile"):
+        o_cloexec = getattr(os, "O_CLOEXEC", 0)
+        src_fd = os.open(src_path, os.O_RDONLY | o_cloexec)
+        try:
+            dst_fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | o_cloexec, 0o666)
+            try:
+                offset = 0
+                while True:
+                    try:
+                        sent = os.sendfile(dst_fd, src_fd, offset, bufsize)
+                    except OSError:
+                        if offset == 0:
+                            break # file system does not support sendfile, fall back below
+                        raise
+                    if sent == 0:
+                        return
+                    offset += sent
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+
+    with io.open(src_path, "rb") as fsrc:
+        with io.open(dst_path, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, bufsize)
+
+
+def stage_to_shm(reference_file_path):
+    """Stage the reference fasta and its index files into POSIX shared memory.
+
+    Copy the reference fasta and its sibling index files (aligner index,
+    faidx index, sequence dictionary) into a content-addressed directory
+    under /dev/shm.  Every subcommand runs in a separate process, so without
+    this, each sample re-reads the reference from its original location --
+    possibly slow network storage.  Files staged in /dev/shm are served from
+    memory for all subsequent processes on the same machine.
+
+    A .last_used file in the staging directory is refreshed on every call so
+    an external cleanup job can evict the least recently used references.
+
+    Parameters
+    ----------
+    reference_file_path : str
+        Path to the reference fasta file.
+
+    Returns
+    -------
+    shm_reference_path : str
+        Path to the staged copy of the reference fasta file, or the original
+        path unchanged when /dev/shm is not available.
+    """
+    if not os.path.isdir("/dev/shm"):
+        return reference_file_path
+
+    fasta_hash = sha256_file(reference_file_path)
+    shm_dir = os.path.join("/dev/shm", "cfsan_snp_pipeline", fasta_hash)
+    mkdir_p(shm_dir)
+
+    # Copy the fasta and every sibling file sharing its base name -- this picks
+    # up the aligner index files, the faidx index, and the sequence dictionary
+    reference_dir = os.path.dirname(os.path.abspath(reference_file_path))
+    reference_file_name = os.path.basename(reference_file_path)
+    reference_base_name = os.path.splitext(reference_file_name)[0]
+    for name in sorted(os.listdir(reference_dir)):
+        src = os.path.join(reference_dir, name)
+        if not name.startswith(reference_base_name) or not os.path.isfile(src):
+            continue
+        dst = os.path.join(shm_dir, name)
+        if os.path.isfile(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+            continue # already staged and fresh
+        # Multiple sample processes can stage the same reference concurrently.
+        # Copy to a process-unique temp name and atomically rename into place,
+        # so other processes only ever see complete files and the freshness
+        # check above never passes on a partially written copy.
+        tmp_dst = dst + ".staging." + str(os.getpid())
+        try:
+            fast_copy(os.path.realpath(src), tmp_dst)
+            shutil.copystat(src, tmp_dst) # preserve mtime so downstream rebuild checks are unaffected
+            os.rename(tmp_dst, dst)
+        except Exception:
+            remove_file(tmp_dst)
+            raise
+
+    with open(os.path.join(shm_dir, ".last_used"), "w") as f:
+        print(timestamp(), file=f)
+
+    return os.path.join(shm_dir, reference_file_name)
+
+
+def sha256_file(file_path):
+    """Compute the SHA-256 digest of the contents of a file.
+
+    The file is memory-mapped and hashed in-place, avoiding the allocation
+    of intermediate byte strings for large files.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the file to hash.
+
+    Returns
+    -------
+    digest : str
+        Hex string digest of the file contents.
+
+    Examples
+    --------
+    # Setup tests
+    >>> from tempfile import NamedTemporaryFile
+
+    # Create a file to hash
+    >>> f = NamedTemporaryFile(delete=False, mode='w')
+    >>> filepath = f.name
+    >>> num_bytes = f.write("Hello")
+    >>> f.close()
+
+    # Hash the file
+    >>> sha256_file(filepath)
+    '185f8db32271fe25f561a6fc938b2e264306ec304eda518007d1764826381969'
+    >>> os.unlink(filepath)
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size > 0:
+            mem = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if hasattr(mem, "madvise"):
+                    mem.madvise(mmap.MADV_SEQUENTIAL) # let the kernel prefetch ahead of the hash
+                hasher.update(mem)
+            finally:
+                mem.close()
+    return hasher.hexdigest()
+
+
+def file_content_hash(file_path):
+    """Compute a fast content hash of a file for freshness checking.
+
+    The optional xxhash package (a non-cryptographic hash running at several
+    GB/s) is used when installed, otherwise sha256.  The digests of the two
+    algorithms have different lengths, so a manifest written with one
+    algorithm never falsely matches digests computed with the other.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the file to hash.
+
+    Returns
+    -------
+    digest : str
+        Hex string digest of the file contents.
+    """
+    try:
+        import xxhash
+    except ImportError:
+        return sha256_file(file_path)
+
+    hasher = xxhash.xxh64()
+    with open(file_path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size > 0:
+            mem = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if hasattr(mem, "madvise"):
+                    mem.madvise(mmap.MADV_SEQUENTIAL) # let the kernel prefetch ahead of the hash
+                hasher.update(mem)
+            finally:
+                mem.close()
+    return hasher.hexdigest()
+
+
+def compute_manifest(file_paths):
+    """Compute the content hash of each of the named files.
+
+    Parameters
+    ----------
+    file_paths : list of str
+        Relative or absolute paths to the files to hash.
+
+    Returns
+    -------
+    manifest : dict
+        Dictionary mapping each file path to the hex string digest of the
+        file contents.  Missing files have no entry.
+    """
+    manifest = dict()
+    for file_path in file_paths:
+        try:
+            manifest[file_path] = file_content_hash(file_path)
+        except EnvironmentError:
+            # A non-existing source file should neither force a rebuild, nor prevent a rebuild,
+            # matching the behavior of target_needs_rebuild().
+            continue
+    return manifest
+
+
+def read_manifest(manifest_file, stage):
+    """Read the stored source file manifest for a pipeline stage.
+
+    Parameters
+    ----------
+    manifest_file : str
+        Path to the JSON manifest file.
+    stage : str
+        Name of the pipeline stage.
+
+    Returns
+    -------
+    manifest : dict or None
+        Dictionary mapping source file paths to content hash digests, or
+        None when the manifest file is missing, unparseable, or has no
+        entry for the stage.
+    """
+    try:
+        with open(manifest_file) as f:
+            stored = json.load(f)
+    except (EnvironmentError, ValueError):
+        return None
+    if not isinstance(stored, dict):
+        return None
+    return stored.get(stage)
+
+
+def write_manifest(manifest_file, stage, manifest):
+    """Store the source file manifest for a pipeline stage, preserving the
+    manifests of other stages sharing the same manifest file.
+
+    Parameters
+    ----------
+    manifest_file : str
+        Path to the JSON manifest file.
+    stage : str
+        Name of the pipeline stage.
+    manifest : dict
+        Dictionary mapping source file paths to content hash digests, as
+        returned by compute_manifest().
+    """
+    try:
+        with open(manifest_file) as f:
+            stored = json.load(f)
+    except (EnvironmentError, ValueError):
+        stored = dict()
+    if not isinstance(stored, dict):
+        stored = dict()
+    stored[stage] = manifest
+    with open(manifest_file, "w") as f:
+        json.dump(stored, f, indent=2, sort_keys=True)
+
+
+def target_needs_rebuild_manifest(source_manifest, target_file, manifest_file, stage):
+    """Determine if a target file needs a fresh rebuild, comparing the
+    content hashes of the source files to a stored manifest.
+
+    Modification times lie when files are copied between hosts or restored
+    from object storage.  When a manifest from a prior build exists, the
+    content hashes alone decide -- the target is rebuilt when any source
+    changed, and left alone when the sources are content-identical even if
+    their timestamps are newer than the target.  When there is no stored
+    manifest, the decision falls back to the mtime comparison of
+    target_needs_rebuild().
+
+    Parameters
+    ----------
+    source_manifest : dict
+        Content hashes of the current source files, as returned by
+        compute_manifest().
+    target_file : str
+        Relative or absolute path to target file.
+    manifest_file : str
+        Path to the JSON manifest file written by write_manifest() when the
+        target was last built.
+    stage : str
+        Name of the pipeline stage.
+
+    Examples
+    --------
+    >>> import json
+    >>> from tempfile import mkdtemp
+    >>> temp_dir = mkdtemp()
+    >>> source_file = os.path.join(temp_dir, "source")
+    >>> target_file = os.path.join(temp_dir, "target")
+    >>> manifest_file = os.path.join(temp_dir, ".cfsan.manifest")
+    >>> f = open(source_file, 'w'); num = f.write("AAAA"); f.close()
+    >>> f = open(target_file, 'w'); num = f.write("TTTT"); f.close()
+
+    # Build the manifest, then touch the source file without changing its
+    # contents -- the newer mtime does not force a rebuild
+    >>> source_manifest = compute_manifest([source_file])
+    >>> write_manifest(manifest_file, "stage1", source_manifest)
+    >>> os.utime(source_file, None)
+    >>> target_needs_rebuild_manifest(compute_manifest([source_file]), target_file, manifest_file, "stage1")
+    False
+
+    # Change the source file contents but backdate its mtime -- the stale
+    # timestamp does not prevent a rebuild
+    >>> f = open(source_file, 'w'); num = f.write("CCCC"); f.close()
+    >>> os.utime(source_file, (0, 0))
+    >>> target_needs_rebuild_manifest(compute_manifest([source_file]), target_file, manifest_file, "stage1")
+    True
+
+    # A different stage has no stored manifest, so mtimes decide
+    >>> target_needs_rebuild_manifest(compute_manifest([source_file]), target_file, manifest_file, "stage2")
+    False
+    >>> import shutil
+    >>> shutil.rmtree(temp_dir)
+    """
+    if not os.path.isfile(target_file):
+        return True
+
+    if os.path.getsize(target_file) == 0:
+        return True
+
+    stored_manifest = read_manifest(manifest_file, stage)
+    if stored_manifest is not None:
+        return stored_manifest != source_manifest
+
+    return target_needs_rebuild(list(source_manifest), target_file)
+
+
 def read_properties(prop_file_path, recognize_vars=False):
     """Read a file of name=value pairs and load them into a dictionary.
 
@@ -402,18 +920,18 @@ def read_properties(prop_file_path, recognize_vars=False):
             # expand known tokens
             if recognize_vars:
                 old_value = None
-                token_regex = "[$][a-zA-Z_]+[a-zA-Z0-9_]*"
+                token_regex = compiled_regex("[$][a-zA-Z_]+[a-zA-Z0-9_]*")
                 while value != old_value:
                     old_value = value
-                    match = re.search(token_regex, value)
+                    match = token_regex.search(value)
                     if match:
                         token = match.group(0)[1:] # drop the leading $
                         if token in properties:
                             token_value = properties[token]
-                            value = re.sub(token_regex, token_value, value, count=1)
+                            value = token_regex.sub(token_value, value, count=1)
                         elif token in os.environ:
                             token_value = os.environ[token]
-                            value = re.sub(token_regex, token_value, value, count=1)
+                            value = token_regex.sub(token_value, value, count=1)
 
             properties[key] = value
 
@@ -486,15 +1004,65 @@ def sample_id_from_file(file_path):
     return sample_id
 
 
-def log_error(message):
-    """Write an error message to the error log if enabled.
+_stop_on_error = None
+
+def _stop_on_sample_error():
+    """Return the effective StopOnSampleError setting, reading the
+    environment variable once and caching the result.
+
+    The cache is filled lazily on the first error rather than at import
+    time, because run_snp_pipeline configures the environment after this
+    module is imported.  The setting never changes once a step is running.
+
+    Returns
+    -------
+    stop_on_error : bool
+        True when the pipeline should stop on a sample error, which is
+        also the default when the variable is unset.
+    """
+    global _stop_on_error
+    if _stop_on_error is None:
+        stop_on_error_env = os.environ.get("StopOnSampleError")
+        _stop_on_error = stop_on_error_env is None or stop_on_error_env == "true"
+    return _stop_on_error
+
+
+_err_log_fh = None
+
+def _error_log_handle():
+    """Return a lazily opened, buffered append handle to the error summary file.
+
+    The error summary file was previously reopened and closed for every
+    logged message.  Keeping a single buffered handle avoids the repeated
+    open/close syscalls when many errors are reported.  Each complete
+    message is still flushed by the caller, so messages from concurrently
+    running processes appending to the same file stay intact.
+
+    Returns
+    -------
+    err_log : file or None
+        Open file handle, or None when the errorOutputFile environment
+        variable is not configured.
     """
+    global _err_log_fh
     # Log to error file if it is defined, which happens automatically if running run_snp_pipeline.sh.
     # The errorOutputFile may also be defined manually if running scripts without run_snp_pipeline.sh.
     error_output_file = os.environ.get("errorOutputFile")
-    if error_output_file:
-        with open(error_output_file, "a") as err_log:
-            print(message, file=err_log)
+    if not error_output_file:
+        return None
+    if _err_log_fh is None or _err_log_fh.closed or _err_log_fh.name != error_output_file:
+        _err_log_fh = open(error_output_file, "a", buffering=65536)
+        atexit.register(_err_log_fh.close)
+    return _err_log_fh
+
+
+def log_error(message):
+    """Write an error message to the error log if enabled.
+    """
+    err_log = _error_log_handle()
+    if err_log:
+        print(message, file=err_log)
+        err_log.flush()
 
 
 def report_error(message):
@@ -525,12 +1093,12 @@ def sample_warning(message):
     message : str
         Warning message text.
     """
-    error_output_file = os.environ.get("errorOutputFile")
-    if error_output_file:
-        with open(error_output_file, "a") as err_log:
-            print("%s warning:" % program_name_with_command(), file=err_log)
-            print(message, file=err_log)
-            print("================================================================================", file=err_log)
+    err_log = _error_log_handle()
+    if err_log:
+        print("%s warning:" % program_name_with_command(), file=err_log)
+        print(message, file=err_log)
+        print("================================================================================", file=err_log)
+        err_log.flush()
 
     # Also send the detail error message to stderr -- this will put the error message in the
     # process-specific log file.
@@ -552,13 +1120,13 @@ def global_error(message):
             Error message
     """
     # Log the event to the error log
-    error_output_file = os.environ.get("errorOutputFile")
-    if error_output_file:
-        with open(error_output_file, "a") as err_log:
-            print("%s failed." % program_name_with_command(), file=err_log)
-            if message:
-                print(message, file=err_log)
-            print("=" * 80, file=err_log)
+    err_log = _error_log_handle()
+    if err_log:
+        print("%s failed." % program_name_with_command(), file=err_log)
+        if message:
+            print(message, file=err_log)
+        print("=" * 80, file=err_log)
+        err_log.flush()
 
     # send the detail error message to stderr -- this will put the error
     # message in the process-specific log file.
@@ -594,19 +1162,18 @@ def sample_error(message, continue_possible=False):
             flag true may allow the code to continue without exiting if
             configured to do so.
     """
-    stop_on_error_env = os.environ.get("StopOnSampleError")
-    stop_on_error = stop_on_error_env is None or stop_on_error_env == "true"
+    stop_on_error = _stop_on_sample_error()
 
     # Log the event to the error log
-    error_output_file = os.environ.get("errorOutputFile")
-    if error_output_file:
-        with open(error_output_file, "a") as err_log:
-            if stop_on_error or not continue_possible:
-                print("%s failed." % program_name_with_command(), file=err_log)
-            else:
-                print("%s" % program_name_with_command(), file=err_log)
-            print(message, file=err_log)
-            print("=" * 80, file=err_log)
+    err_log = _error_log_handle()
+    if err_log:
+        if stop_on_error or not continue_possible:
+            print("%s failed." % program_name_with_command(), file=err_log)
+        else:
+            print("%s" % program_name_with_command(), file=err_log)
+        print(message, file=err_log)
+        print("=" * 80, file=err_log)
+        err_log.flush()
 
     # send the detail error message to stderr -- this will put the error
     # message in the process-specific log file.
@@ -637,26 +1204,26 @@ def handle_global_exception(exc_type, exc_value, exc_traceback):
         external_program_command = exc_value.cmd
 
     # Report the exception in the error log if configuired
-    error_output_file = os.environ.get("errorOutputFile")
-    if error_output_file:
-        with open(error_output_file, "a") as err_log:
-            trace_entries = traceback.extract_tb(exc_traceback)
-            file_name, line_number, function_name, code_text = trace_entries[-1]
-            exc_type_name = exc_type.__name__
-
-            print("Error detected while running %s." % program_name_with_command(), file=err_log)
-            print("", file=err_log)
-            print("The command line was:", file=err_log)
-            print("    %s" % command_line_short(), file=err_log)
-            print("", file=err_log)
-
-            if external_program_command:
-                print("The error occured while running:", file=err_log)
-                print("    %s" % external_program_command, file=err_log)
-            else:
-                print("%s exception in function %s at line %d in file %s" % (exc_type_name, function_name, line_number, file_name), file=err_log)
-                print("    %s" % code_text, file=err_log)
-            print("=" * 80, file=err_log)
+    err_log = _error_log_handle()
+    if err_log:
+        trace_entries = traceback.extract_tb(exc_traceback)
+        file_name, line_number, function_name, code_text = trace_entries[-1]
+        exc_type_name = exc_type.__name__
+
+        print("Error detected while running %s." % program_name_with_command(), file=err_log)
+        print("", file=err_log)
+        print("The command line was:", file=err_log)
+        print("    %s" % command_line_short(), file=err_log)
+        print("", file=err_log)
+
+        if external_program_command:
+            print("The error occured while running:", file=err_log)
+            print("    %s" % external_program_command, file=err_log)
+        else:
+            print("%s exception in function %s at line %d in file %s" % (exc_type_name, function_name, line_number, file_name), file=err_log)
+            print("    %s" % code_text, file=err_log)
+        print("=" * 80, file=err_log)
+        err_log.flush()
 
     # Report the exception in the usual way to stderr
     sys.stdout.flush() # make sure stdout is flushed before printing the trace
@@ -683,26 +1250,26 @@ def handle_sample_exception(exc_type, exc_value, exc_traceback):
         external_program_command = exc_value.cmd
 
     # Report the exception in the error log if configuired
-    error_output_file = os.environ.get("errorOutputFile")
-    if error_output_file:
-        with open(error_output_file, "a") as err_log:
-            trace_entries = traceback.extract_tb(exc_traceback)
-            file_name, line_number, function_name, code_text = trace_entries[-1]
-            exc_type_name = exc_type.__name__
-
-            print("Error detected while running %s." % program_name_with_command(), file=err_log)
-            print("", file=err_log)
-            print("The command line was:", file=err_log)
-            print("    %s" % command_line_short(), file=err_log)
-            print("", file=err_log)
-
-            if external_program_command:
-                print("The error occured while running:", file=err_log)
-                print("    %s" % external_program_command, file=err_log)
-            else:
-                print("%s exception in function %s at line %d in file %s" % (exc_type_name, function_name, line_number, file_name), file=err_log)
-                print("    %s" % code_text, file=err_log)
-            print("=" * 80, file=err_log)
+    err_log = _error_log_handle()
+    if err_log:
+        trace_entries = traceback.extract_tb(exc_traceback)
+        file_name, line_number, function_name, code_text = trace_entries[-1]
+        exc_type_name = exc_type.__name__
+
+        print("Error detected while running %s." % program_name_with_command(), file=err_log)
+        print("", file=err_log)
+        print("The command line was:", file=err_log)
+        print("    %s" % command_line_short(), file=err_log)
+        print("", file=err_log)
+
+        if external_program_command:
+            print("The error occured while running:", file=err_log)
+            print("    %s" % external_program_command, file=err_log)
+        else:
+            print("%s exception in function %s at line %d in file %s" % (exc_type_name, function_name, line_number, file_name), file=err_log)
+            print("    %s" % code_text, file=err_log)
+        print("=" * 80, file=err_log)
+        err_log.flush()
 
     # Report the exception in the usual way to stderr
     sys.stdout.flush() # make sure stdout is flushed before printing the trace
@@ -715,8 +1282,7 @@ def handle_sample_exception(exc_type, exc_value, exc_traceback):
     # Exit 100 does two things:
     # 1. Sun Grid Engine will stop execution of dependent jobs
     # 2. run_snp_pipeline.sh will know this error has already been reported
-    stop_on_error_env = os.environ.get("StopOnSampleError")
-    stop_on_error = stop_on_error_env is None or stop_on_error_env == "true"
+    stop_on_error = _stop_on_sample_error()
     if stop_on_error:
         # run_snp_pipeline.sh will know this error has already been reported
         sys.exit(100)
@@ -751,6 +1317,32 @@ def which(executable):
     return None
 
 
+def _stat_or_none(file_path):
+    """Stat a file, returning None when the file does not exist.
+
+    A single stat result answers existence, size, and timestamp questions
+    together, avoiding the separate syscalls of isfile + getsize + stat.
+
+    Parameters
+    ----------
+    file_path : str
+        Relative or absolute path to a file.
+
+    Returns
+    -------
+    stat_result : os.stat_result or None
+        Stat result of the file, or None when the path does not exist or is
+        not a regular file.
+    """
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
+        return None
+    if not stat_module.S_ISREG(stat_result.st_mode):
+        return None
+    return stat_result
+
+
 def verify_existing_input_files(error_prefix, file_list, error_handler=None, continue_possible=False):
     """Verify each file in a list of files exists.  It does
     not matter whether the file is empty.
@@ -785,7 +1377,7 @@ def verify_existing_input_files(error_prefix, file_list, error_handler=None, con
     err_messages = []
     for file_path in file_list:
 
-        if not os.path.isfile(file_path):
+        if _stat_or_none(file_path) is None:
             err_messages.append("%s %s does not exist." % (error_prefix, file_path))
             continue
 
@@ -836,10 +1428,11 @@ def verify_non_empty_input_files(error_prefix, file_list, error_handler=None, co
     err_messages = []
     for file_path in file_list:
 
-        if not os.path.isfile(file_path):
+        file_stat = _stat_or_none(file_path)
+        if file_stat is None:
             err_messages.append("%s %s does not exist." % (error_prefix, file_path))
             continue
-        if not empty_ok and os.path.getsize(file_path) == 0:
+        if not empty_ok and file_stat.st_size == 0:
             err_messages.append("%s %s is empty." % (error_prefix, file_path))
             continue
 
@@ -985,13 +1578,14 @@ def target_needs_rebuild(source_files, target_file):
     target_file : str
         Relative or absolute path to target file.
     """
-    if not os.path.isfile(target_file):
+    target_stat = _stat_or_none(target_file)
+    if target_stat is None:
         return True
 
-    if os.path.getsize(target_file) == 0:
+    if target_stat.st_size == 0:
         return True
 
-    target_timestamp = os.stat(target_file).st_mtime
+    target_timestamp = target_stat.st_mtime
 
     for source_file in source_files:
         # A non-existing source file should neither force a rebuild, nor prevent a rebuild.
@@ -999,11 +1593,11 @@ def target_needs_rebuild(source_files, target_file):
         #
         # An empty source file should force a rebuild if it is newer than the target, just like
         # a regular non-empty source file.
-        if not os.path.isfile(source_file):
+        source_stat = _stat_or_none(source_file)
+        if source_stat is None:
             continue
 
-        source_timestamp = os.stat(source_file).st_mtime
-        if source_timestamp > target_timestamp:
+        if source_stat.st_mtime > target_timestamp:
             return True
 
     return False
@@ -1020,39 +1614,120 @@ def targets_needs_rebuild(source_files, target_files):
 
     if len(target_files) == 0:
         return True
-    else:
-        if not os.path.isfile(target_files[0]):
-            return True
 
-        oldest_timestamp = os.stat(target_files[0]).st_mtime
-
-        if os.path.getsize(target_files) == 0:
+    # A single stat per file answers the existence, size, and timestamp
+    # checks together
+    oldest_timestamp = float("inf")
+    for target_file in target_files:
+        try:
+            target_stat = os.stat(target_file)
+        except OSError:
             return True
+        if target_stat.st_size == 0:
+            return True
+        if target_stat.st_mtime < oldest_timestamp:
+            oldest_timestamp = target_stat.st_mtime
 
-        for target_file in target_files:
-            if (not os.path.isfile(target_file)) or (os.path.getsize(target_file) == 0):
-                return True
-
-            target_timestamp = os.stat(target_file).st_mtime
-            if oldest_timestamp > target_timestamp:
-                oldest_timestamp = target_timestamp
-
-        for source_file in source_files:
-            # A non-existing source file should neither force a rebuild, nor prevent a rebuild.
-            # You should error-check the existence of the source files before calling this function.
-            #
-            # An empty source file should force a rebuild if it is newer than the target, just like
-            # a regular non-empty source file.
-            if not os.path.isfile(source_file):
-                continue
-
+    for source_file in source_files:
+        # A non-existing source file should neither force a rebuild, nor prevent a rebuild.
+        # You should error-check the existence of the source files before calling this function.
+        #
+        # An empty source file should force a rebuild if it is newer than the target, just like
+        # a regular non-empty source file.
+        try:
             source_timestamp = os.stat(source_file).st_mtime
-            if source_timestamp > oldest_timestamp:
-                return True
+        except OSError:
+            continue
+        if source_timestamp > oldest_timestamp:
+            return True
 
     return False
 
 
+def collect_sample_files(sample_directories, file_name):
+    """Find a named file in each of the sample directories and capture the
+    file stat results in a single pass.
+
+    Each sample directory is scanned once with os.scandir() and the stat
+    result of the matching directory entry is cached, so subsequent existence,
+    size, and timestamp checks do not issue any extra system calls per file.
+
+    Parameters
+    ----------
+    sample_directories : list of str
+        Relative or absolute paths to the sample directories.
+    file_name : str
+        File name to find in each of the sample directories.
+
+    Returns
+    -------
+    file_paths : list of str
+        Path to the named file in each sample directory, in the same order
+        as the sample directories.  The files are not guaranteed to exist.
+    stats : dict
+        Dictionary mapping each existing file path to its os.stat_result.
+        Missing files and missing sample directories have no entry.
+
+    Examples
+    --------
+    >>> import shutil
+    >>> from tempfile import mkdtemp
+    >>> temp_dir = mkdtemp()
+    >>> dir1 = os.path.join(temp_dir, "sample1"); mkdir_p(dir1)
+    >>> dir2 = os.path.join(temp_dir, "sample2"); mkdir_p(dir2)
+    >>> f = open(os.path.join(dir1, "metrics"), 'w'); num = f.write("aaaa"); f.close()
+    >>> file_paths, stats = collect_sample_files([dir1, dir2], "metrics")
+    >>> [os.path.relpath(p, temp_dir) for p in file_paths]
+    ['sample1/metrics', 'sample2/metrics']
+    >>> [p in stats for p in file_paths]
+    [True, False]
+    >>> stats[file_paths[0]].st_size
+    4
+    >>> shutil.rmtree(temp_dir)
+    """
+    file_paths = []
+    stats = dict()
+    for directory in sample_directories:
+        file_path = os.path.join(directory, file_name)
+        file_paths.append(file_path)
+        try:
+            with os.scandir(directory) as dir_entries:
+                for entry in dir_entries:
+                    if entry.name == file_name:
+                        stats[file_path] = entry.stat()
+                        break
+        except OSError:
+            continue # a missing sample directory is reported like a missing file
+    return file_paths, stats
+
+
+def target_needs_rebuild_stats(source_stats, target_file):
+    """Determine if a target file needs a fresh rebuild, given previously
+    captured stat results for the source files.
+
+    This is the same check as target_needs_rebuild(), but the source file
+    timestamps come from cached os.stat_result objects, so the only system
+    call issued is a single stat of the target file.
+
+    Parameters
+    ----------
+    source_stats : iterable of os.stat_result
+        Stat results of the source files, as captured by collect_sample_files().
+    target_file : str
+        Relative or absolute path to target file.
+    """
+    try:
+        target_stat = os.stat(target_file)
+    except OSError:
+        return True
+
+    if target_stat.st_size == 0:
+        return True
+
+    target_timestamp = target_stat.st_mtime
+    return any(source_stat.st_mtime > target_timestamp for source_stat in source_stats)
+
+
 def write_list_of_snps(file_path, snp_dict):
     """Write out list of snps for all samples to a single file.
 
@@ -1064,10 +1739,27 @@ def write_list_of_snps(file_path, snp_dict):
         Nothing
     """
 
+    import numpy as np # deferred import, numpy is slow to import
+
+    # Group the positions per chromosome and sort each group as int64 in C --
+    # much cheaper than Python tuple comparisons over millions of keys
+    positions_by_chrom = dict()
+    for chrom, pos in snp_dict:
+        positions_by_chrom.setdefault(chrom, []).append(pos)
+
+    # Build all the lines in memory and write them in one call, instead of
+    # issuing one write per snp
+    lines = []
+    for chrom in sorted(positions_by_chrom):
+        positions = np.array(positions_by_chrom[chrom], dtype=np.int64)
+        positions.sort()
+        for pos in positions:
+            pos = int(pos)
+            sample_list = snp_dict[(chrom, pos)]
+            lines.append("%s\t%d\t%d\t%s\n" % (chrom, pos, len(sample_list), "\t".join(sample_list)))
+
     with open(file_path, "w") as snp_list_file_object:
-        for key in sorted(snp_dict.keys()):
-            sample_list = snp_dict[key]
-            snp_list_file_object.write("%s\t%d\t%d\t%s\n" % (key[0], key[1], len(sample_list), "\t".join(sample_list)))
+        snp_list_file_object.write(''.join(lines))
 
 
 def read_snp_position_list(snp_list_file_path):
@@ -1081,13 +1773,89 @@ def read_snp_position_list(snp_list_file_path):
     """
 
     snp_list = list()
+    append = snp_list.append # avoid the repeated attribute lookup in the loop
     with open(snp_list_file_path, "r") as snp_list_file_object:
         for line in snp_list_file_object:
-            chrom, pos = line.split()[0:2]
-            snp_list.append((chrom, int(pos)))
+            # Split only the first two tab-separated columns -- the rest of the
+            # line lists the sample names and is not needed here
+            chrom, pos, _ = line.split('\t', 2)
+            append((chrom, int(pos)))
     return snp_list
 
 
+def read_fasta_dict(fasta_file_path):
+    """Read a fasta file into a dictionary mapping contig names to uppercase sequence strings.
+
+    When the pysam package is installed, the file is read through the htslib
+    faidx reader.  Otherwise, a lightweight plain-text parser is used.  Neither
+    path allocates per-contig Biopython SeqRecord objects, so large references
+    parse considerably faster than with SeqIO.
+
+    Parameters
+    ----------
+    fasta_file_path : str
+        Path to the fasta file.
+
+    Returns
+    -------
+    sequences : OrderedDict
+        Dictionary mapping contig names to uppercase sequence strings, in
+        file order.  The contig name is the portion of the defline up to the
+        first whitespace.
+
+    Examples
+    --------
+    # Setup tests
+    >>> from tempfile import NamedTemporaryFile
+
+    # Create a fasta file
+    >>> f = NamedTemporaryFile(delete=False, mode='w', suffix=".fasta")
+    >>> filepath = f.name
+    >>> print(">a description", file=f)
+    >>> print("acgt", file=f)
+    >>> print("AAAA", file=f)
+    >>> print(">b", file=f)
+    >>> print("GGCC", file=f)
+    >>> f.close()
+
+    # Read the fasta file
+    >>> read_fasta_dict(filepath)
+    OrderedDict([('a', 'ACGTAAAA'), ('b', 'GGCC')])
+    >>> os.unlink(filepath)
+    >>> remove_file(filepath + ".fai")
+    """
+    try:
+        import pysam
+    except ImportError:
+        pysam = None
+
+    sequences = OrderedDict()
+
+    if pysam is not None:
+        fasta = pysam.FastaFile(fasta_file_path)
+        try:
+            for name in fasta.references:
+                sequences[name] = fasta.fetch(reference=name).upper()
+        finally:
+            fasta.close()
+        return sequences
+
+    with open(fasta_file_path) as f:
+        name = None
+        chunks = []
+        for line in f:
+            if line.startswith(">"):
+                if name is not None:
+                    sequences[name] = "".join(chunks).upper()
+                name = line[1:].split()[0]
+                chunks = []
+            else:
+                chunks.append(line.rstrip())
+        if name is not None:
+            sequences[name] = "".join(chunks).upper()
+    return sequences
+
+
 def write_reference_snp_file(reference_file_path, snp_list_file_path,
                              snp_reference_file_path):
     """Write out the snp fasta file for the reference.fasta using the snp
@@ -1095,17 +1863,24 @@ def write_reference_snp_file(reference_file_path, snp_list_file_path,
     """
     #TODO finish documentation
     #TODO actual code is more general than stated. Fix this.
-
+    from collections import defaultdict
+    from Bio import SeqIO
+    from Bio.Seq import Seq
+    from Bio.SeqRecord import SeqRecord
+
+    # Group the snp positions per chromosome in a single pass, so each
+    # chromosome below only visits its own positions
+    positions_by_chrom = defaultdict(list)
     with open(snp_list_file_path, "r") as snp_list_file:
-        position_list = [line.split()[0:2] for line in snp_list_file]
-    match_dict = SeqIO.to_dict(SeqIO.parse(reference_file_path, "fasta"))
+        for line in snp_list_file:
+            chrom_id, pos = line.split()[0:2]
+            positions_by_chrom[chrom_id].append(int(pos))
+    match_dict = read_fasta_dict(reference_file_path)
 
     with open(snp_reference_file_path, "w") as snp_reference_file_object:
         for ordered_id in sorted(match_dict.keys()):
-            ref_str = ""
-            for chrom_id, pos in position_list:
-                if chrom_id == ordered_id:
-                    ref_str += match_dict[ordered_id][int(pos) - 1].upper()
+            seq = match_dict[ordered_id]
+            ref_str = ''.join([seq[pos - 1] for pos in positions_by_chrom.get(ordered_id, [])])
             record = SeqRecord(Seq(ref_str), id=ordered_id, description="")
             SeqIO.write([record], snp_reference_file_object, "fasta")
 
@@ -1120,18 +1895,126 @@ def convert_vcf_file_to_snp_set(vcf_file_path):
         snp_set  : set of (CHROM, POS) tuples
 
     """
-
     snp_set = set()
 
+    # Only CHROM and POS are needed, so scan the tab-separated columns directly
+    # instead of paying for PyVCF's full record construction per data line
     with open(vcf_file_path, 'r') as vcf_file_object:
-        vcf_reader = vcf.Reader(vcf_file_object)
-        for vcf_data_line in vcf_reader:
-            key = (vcf_data_line.CHROM, vcf_data_line.POS)
-            snp_set.add(key)
+        for line in vcf_file_object:
+            if line.startswith('#'):
+                continue
+            chrom, pos, _ = line.split('\t', 2)
+            snp_set.add((chrom, int(pos)))
 
     return snp_set
 
 
+def pack_acgt(buf):
+    """Pack a buffer of ACGT bases into 2-bit codes, 4 bases per byte.
+
+    Each base is encoded branchlessly as (byte >> 1) & 3, which maps the
+    ASCII codes to A=0, C=1, T=2, G=3 regardless of case.  Four codes are
+    packed per output byte with the first base in the most significant bits.
+    The packed array is one quarter the size of the input, so downstream
+    vectorized comparisons touch less memory.
+
+    Note the encoding is only meaningful for A, C, G, T bases.  Other bytes
+    are packed without complaint but collide with the real bases (N packs
+    the same as G, for example).
+
+    Parameters
+    ----------
+    buf : bytes
+        Buffer of ACGT bases, upper or lower case.
+
+    Returns
+    -------
+    packed : numpy.ndarray of uint8
+        Packed array of 2-bit base codes, 4 bases per byte.  The final byte
+        is zero-padded when the buffer length is not a multiple of 4.
+
+    Examples
+    --------
+    >>> pack_acgt(b"ACGTACGT")
+    array([30, 30], dtype=uint8)
+    >>> pack_acgt(b"acg")
+    array([28], dtype=uint8)
+    """
+    import numpy as np # deferred import, numpy is slow to import
+
+    codes = (np.frombuffer(buf, dtype=np.uint8) >> 1) & 3
+    pad = -len(codes) % 4
+    if pad:
+        codes = np.append(codes, np.zeros(pad, dtype=np.uint8))
+    codes = codes.reshape(-1, 4)
+    return (codes[:, 0] << 6 | codes[:, 1] << 4 | codes[:, 2] << 2 | codes[:, 3]).astype(np.uint8)
+
+
+def unpack_acgt(packed, length):
+    """Unpack an array of 2-bit base codes back into upper case ACGT bases.
+
+    This is the inverse of pack_acgt().
+
+    Parameters
+    ----------
+    packed : numpy.ndarray of uint8
+        Packed array of 2-bit base codes, 4 bases per byte, first base in
+        the most significant bits.
+    length : int
+        Number of bases to unpack, needed to discard the zero-padding of the
+        final byte.
+
+    Returns
+    -------
+    buf : bytes
+        Buffer of upper case ACGT bases.
+
+    Examples
+    --------
+    >>> unpack_acgt(pack_acgt(b"ACGTACGT"), 8)
+    b'ACGTACGT'
+    >>> unpack_acgt(pack_acgt(b"acg"), 3)
+    b'ACG'
+    """
+    import numpy as np # deferred import, numpy is slow to import
+
+    codes = np.empty((len(packed), 4), dtype=np.uint8)
+    codes[:, 0] = packed >> 6
+    codes[:, 1] = (packed >> 4) & 3
+    codes[:, 2] = (packed >> 2) & 3
+    codes[:, 3] = packed & 3
+    bases = np.frombuffer(b"ACTG", dtype=np.uint8)[codes.reshape(-1)[:length]]
+    return bases.tobytes()
+
+
+_utils_nb = False # False = import not yet attempted, None = unavailable
+
+def import_utils_nb():
+    """Import and return the Numba-compiled helper module, or None when unavailable.
+
+    The import is attempted once and the result is remembered.  Setting the
+    environment variable CFSAN_NUMBA=0 disables the compiled helpers even
+    when numba is installed.
+
+    Returns
+    -------
+    utils_nb : module or None
+        The snppipeline.utils_nb module, or None when numba is not installed
+        or compiled helpers are disabled.
+    """
+    global _utils_nb
+    if _utils_nb is False:
+        if os.environ.get("CFSAN_NUMBA", "1") == "0":
+            _utils_nb = None
+        else:
+            try:
+                from snppipeline import utils_nb
+                _utils_nb = utils_nb
+            except ImportError:
+                _utils_nb = None
+    return _utils_nb
+
+
 def calculate_sequence_distance(seq1, seq2, case_insensitive=True):
     """Calulate the number of nucleotide differences between two sequences.
 
@@ -1145,24 +2028,27 @@ def calculate_sequence_distance(seq1, seq2, case_insensitive=True):
     Returns:
         int number of differences
     """
+    utils_nb = import_utils_nb()
+    if utils_nb is not None:
+        return utils_nb.sequence_distance(seq1, seq2, case_sensitive=not case_insensitive)
+
+    import numpy as np # deferred import, numpy is slow to import
+
+    a = np.frombuffer(seq1.encode('ascii'), dtype=np.uint8)
+    b = np.frombuffer(seq2.encode('ascii'), dtype=np.uint8)
+
     if case_insensitive:
-        allowed_bases = frozenset(['A', 'C', 'G', 'T'])
-        seq1 = seq1.upper()
-        seq2 = seq2.upper()
-    else:
-        allowed_bases = frozenset(['A', 'C', 'G', 'T', 'a', 'c', 'g', 't'])
+        a = a & 0xDF # clearing bit 5 upper-cases ascii letters
+        b = b & 0xDF
 
-    mismatches = 0
-    for pos in range(len(seq1)):
-        base1 = seq1[pos]
-        base2 = seq2[pos]
-        if base1 not in allowed_bases:
-            continue
-        if base2 not in allowed_bases:
-            continue
-        if base1 != base2:
-            mismatches += 1
-    return mismatches
+    # Positions where either sequence has a base other than ACGT (upper or
+    # lower case when case sensitive) are excluded from the comparison
+    au = a & 0xDF
+    bu = b & 0xDF
+    valid = (au == 65) | (au == 67) | (au == 71) | (au == 84)
+    valid &= (bu == 65) | (bu == 67) | (bu == 71) | (bu == 84)
+
+    return int(np.count_nonzero(valid & (a != b)))
 
 
 def merge_regions(regions):
@@ -1266,20 +2152,25 @@ def merge_regions(regions):
     """
     if len(regions) == 0:
         return regions
-    regions = sorted(regions)
-    merged_regions = list()
-    merged_regions.append(regions[0])
-    for region in regions[1:]:
-        last_merged_region = merged_regions[-1]
-        last_merged_region_start, last_merged_region_end = last_merged_region
-        region_start, region_end = region
-        if region_start >= last_merged_region_start and region_end <= last_merged_region_end:
-            pass # discard region contained in the last region
-        elif region_start <= (last_merged_region_end + 1) and region_end > last_merged_region_end:
-            merged_regions[-1] = (last_merged_region_start, region_end) # extend last region by overlapping or adjacent region
-        else:
-            merged_regions.append(region) # add non-overlapping region to sorted list
-    return merged_regions
+
+    import numpy as np # deferred import, numpy is slow to import
+
+    # Sweep-line over the sorted region boundaries: +1 at each start, -1 just
+    # past each end, then a running sum of the depth.  Merged regions start
+    # where the depth rises from 0 and end where it falls back to 0.  Ends are
+    # offset by one so immediately adjacent regions coalesce.  All the work
+    # happens in C-level sort and cumsum passes instead of tuple iteration.
+    arr = np.asarray(regions, dtype=np.int64)
+    num_regions = len(arr)
+    points = np.concatenate([arr[:, 0], arr[:, 1] + 1])
+    deltas = np.concatenate([np.ones(num_regions, np.int64), -np.ones(num_regions, np.int64)])
+    order = np.argsort(points, kind="stable") # stable keeps starts before ends at equal points
+    points = points[order]
+    depths = np.cumsum(deltas[order])
+    previous_depths = np.concatenate([[0], depths[:-1]])
+    starts = points[(depths == 1) & (previous_depths == 0)]
+    ends = points[depths == 0] - 1
+    return list(zip(starts.tolist(), ends.tolist()))
 
 
 def in_region(pos, regions):
@@ -1290,7 +2181,8 @@ def in_region(pos, regions):
     pos : int
         DNA base position.
     regions : list of tuples
-        List of (start, end) position integers.
+        List of (start, end) position integers, sorted by start position and
+        non-overlapping, as produced by merge_regions().
 
     Returns
     -------
@@ -1311,11 +2203,10 @@ def in_region(pos, regions):
     >>> in_region(10, [(3, 5), (11, 12)])
     False
     """
-    for region in regions:
-        if (pos >= region[0]) and (pos <= region[1]):
-            return True
-
-    return False
+    # Binary search for the last region starting at or before the position --
+    # O(log R) per query instead of scanning all the regions
+    idx = bisect.bisect_right(regions, (pos, float("inf"))) - 1
+    return idx >= 0 and pos <= regions[idx][1]
 
 
 def compute_num_processes_and_threads(max_cpu_cores, threads_per_process):
@@ -1484,9 +2375,9 @@ def configure_process_threads(extra_params_env_var, threads_option, default_thre
     threads_options = [threads_option] if type(threads_option) is str else threads_option
     match = False
     for threads_option in threads_options:
-        regex_str = threads_option + "[ \t]*([0-9]+)"
+        regex = compiled_regex(threads_option + "[ \t]*([0-9]+)")
         extra_params = os.environ.get(extra_params_env_var, "")
-        match = re.search(regex_str, extra_params)
+        match = regex.search(extra_params)
         if match:
             break # stop looking for thread control options in the command line as soon as we find the first one
     if match:
@@ -1499,7 +2390,7 @@ def configure_process_threads(extra_params_env_var, threads_option, default_thre
 
     threads_option += ' ' + str(threads_per_process)
     if match and threads_per_process != configured_threads_per_process:
-        extra_params = re.sub(regex_str, threads_option, extra_params)
+        extra_params = regex.sub(threads_option, extra_params)
         os.environ[extra_params_env_var] = extra_params
     elif not match:
         if extra_params:
@@ -1509,6 +2400,41 @@ def configure_process_threads(extra_params_env_var, threads_option, default_thre
     return max_processes, threads_per_process
 
 
+def schedule_by_size(sizes):
+    """Determine the order of execution of parallel tasks given the task sizes.
+
+    Assuming the task processing time grows with the size of the task input,
+    scheduling the largest tasks first (the classic Longest Processing Time
+    list-scheduling rule) keeps a pool of parallel workers evenly busy and
+    avoids a single large task delaying completion at the end of the run.
+
+    Parameters
+    ----------
+    sizes : list of int
+        Size of the input to each task, for example file sizes in bytes.
+
+    Returns
+    -------
+    permutation : list of int
+        Indexes into the sizes list ordering the tasks largest first.
+
+    Examples
+    --------
+    # Empty list
+    >>> schedule_by_size([])
+    []
+
+    # Largest first
+    >>> schedule_by_size([30, 10, 20])
+    [0, 2, 1]
+
+    # Stable order when sizes are equal
+    >>> schedule_by_size([10, 20, 20])
+    [1, 2, 0]
+    """
+    return sorted(range(len(sizes)), key=lambda idx: -sizes[idx])
+
+
 def find_path_in_path_list(search_item, env_var, case_sensitive=False):
     """Search a colon-separated environment variable for a specified string.
     Return the path containing the string.
@@ -0,0 +1,75 @@
+"""This module is part of the CFSAN SNP Pipeline. It contains Numba-compiled
+implementations of hot numeric loops.  Importing this module fails with
+ImportError when numba is not installed; callers are expected to catch the
+error and fall back to the pure-Python implementations in utils.
+"""
+
+from __future__ import absolute_import
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def _sequence_distance_uint8(a, b, case_sensitive):
+    """Count the mismatching unambiguous bases between two uint8 sequence arrays.
+
+    Positions where either array holds a byte other than A, C, G, T (also
+    a, c, g, t when case_sensitive) are ignored.
+
+    Parameters
+    ----------
+    a : numpy array of uint8
+        First sequence as ascii byte values.
+    b : numpy array of uint8
+        Second sequence as ascii byte values, same length as a.
+    case_sensitive : bool
+        When False, bases are upper-cased before comparing.
+
+    Returns
+    -------
+    mismatches : int
+        Number of positions where the unambiguous bases differ.
+    """
+    mismatches = 0
+    for i in range(a.shape[0]):
+        x = a[i]
+        y = b[i]
+        if not case_sensitive:
+            if x >= 97 and x <= 122:
+                x -= 32
+            if y >= 97 and y <= 122:
+                y -= 32
+        x_allowed = x == 65 or x == 67 or x == 71 or x == 84
+        y_allowed = y == 65 or y == 67 or y == 71 or y == 84
+        if case_sensitive:
+            x_allowed = x_allowed or x == 97 or x == 99 or x == 103 or x == 116
+            y_allowed = y_allowed or y == 97 or y == 99 or y == 103 or y == 116
+        if x_allowed and y_allowed and x != y:
+            mismatches += 1
+    return mismatches
+
+
+def sequence_distance(seq1, seq2, case_sensitive=False):
+    """Calculate the number of nucleotide differences between two sequences.
+
+    This is the compiled counterpart of utils.calculate_sequence_distance.
+    The sequences must be the same length.
+
+    Parameters
+    ----------
+    seq1 : str
+        DNA string 1.
+    seq2 : str
+        DNA string 2, same length as seq1.
+    case_sensitive : bool, optional defaults to False
+        When False, bases are upper-cased before comparing.
+
+    Returns
+    -------
+    mismatches : int
+        Number of positions where the unambiguous bases differ.
+    """
+    a = np.frombuffer(seq1.encode("ascii"), dtype=np.uint8)
+    b = np.frombuffer(seq2.encode("ascii"), dtype=np.uint8)
+    return int(_sequence_distance_uint8(a, b, case_sensitive))
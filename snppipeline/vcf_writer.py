@@ -45,7 +45,13 @@ VCF_FORMAT  = '''
 ##FORMAT=<ID=FT,Number=1,Type=String,Description="Genotype filters using the same codes as the FILTER data element">
 '''
 VCF_REFERENCE = '##reference=%s\n'
-VCF_HDR_LINE  = '#CHROM  POS     ID      REF     ALT     QUAL    FILTER  INFO    FORMAT  %s\n'
+VCF_HDR_LINE  = '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t%s\n'
+
+# The format tokens are derived from the format header lines above, so they
+# are computed once here instead of every time a writer is constructed.
+_FORMAT_TOKENS = [line.replace("##FORMAT=<ID=", "").split(',')[0] for line in VCF_FORMAT.split('\n') if line]
+_FORMAT_STR = ':'.join(_FORMAT_TOKENS)
+_VcfCallData = collections.namedtuple('VcfCallData', _FORMAT_TOKENS)
 
 
 #==============================================================================
@@ -72,21 +78,70 @@ class SingleSampleWriter(object):
             reference base is emitted in uppercase.
         """
         if isinstance(file, str):
+            # Open in binary mode -- the output is plain ascii, and writing
+            # bytes skips the per-write encoding layer of a text stream.
+            # Each batch of records is encoded once just before writing.
             self.file_path = file
-            self.file_handle = open(file, "w")
+            self.file_handle = open(file, "wb")
+
+            def write_text(text, _write=self.file_handle.write):
+                _write(text.encode('ascii'))
         else:
             self.file_path = file.name
             self.file_handle = file
+            write_text = file.write
+        self._write_text = write_text
 
         self.preserve_ref_case = preserve_ref_case
 
+        # Bind the reference-case handling once -- the setting never changes
+        # after construction, so the per-record branch is evaluated here
+        if preserve_ref_case:
+            def ref_case(ref):
+                return ref, ref.upper()
+        else:
+            def ref_case(ref):
+                upper_ref = ref.upper()
+                return upper_ref, upper_ref
+        self._ref_case = ref_case
+
+        # Records are batched here and written in large chunks
+        self._out_buf = []
+
+        self.set_failed_snp_gt('.')
+
+    def set_failed_snp_gt(self, failed_snp_gt):
+        """
+        Resolve the GT data element emitted for records that fail filters.
+
+        The setting is constant for a whole pipeline invocation, so it is
+        resolved here once instead of once per record.
+
+        Parameters
+        ----------
+        failed_snp_gt : str
+            Controls the VCF file GT data element when a snp fails filters.  Possible values:
+            "." : The GT element will be a dot, indicating unable to make a call (default)
+            "0" : The GT element will be 0, indicating the reference base
+            "1" : The GT element will be the ALT index of the most commonly occuring base, usually 1
+        """
+        self._failed_snp_gt = failed_snp_gt
+        self._failed_gt = failed_snp_gt if failed_snp_gt in ('.', '0') else '1'
+
+    def flush(self):
+        """
+        Write any batched records to the underlying file.
+        """
+        if self._out_buf:
+            self._write_text(''.join(self._out_buf))
+            del self._out_buf[:]
+
     def close(self):
         """
         Close the VCF writer.
         This method should be called after iterating through all the records.
         """
-        if self.pyvcf_writer:
-            self.pyvcf_writer.close()
+        self.flush()
         self.file_handle.close()
 
     def write_header(self, sample_id, filters, reference):
@@ -103,35 +158,65 @@ class SingleSampleWriter(object):
         reference : str
             Reference name which will be written to the header reference line.
         """
-        # Write the template header to an in-memory buffer
-        in_memory_file = StringIO()
-        in_memory_file.name = "header.vcf"
-        in_memory_file.write(VCF_VERSION)
-        in_memory_file.write(datetime.datetime.strftime(datetime.datetime.now(), VCF_DATE))
-        in_memory_file.write(VCF_SOURCE)
-        in_memory_file.write(VCF_INFO)
-        in_memory_file.write(VCF_FILTER % ("PASS", "All filters passed"))
+        # Write the header lines directly to the vcf file.  The lines are
+        # emitted in the same order pyVcf used to write them, so the header
+        # is unchanged from earlier versions of this writer.
+        write = self._write_text
+        write(VCF_VERSION)
+        write(datetime.datetime.strftime(datetime.datetime.now(), VCF_DATE))
+        write(VCF_SOURCE)
+        write(VCF_REFERENCE % reference)
+        write(VCF_INFO)
+        write(VCF_FORMAT.lstrip('\n'))
+        write(VCF_FILTER % ("PASS", "All filters passed"))
         for name, description in filters:
-            in_memory_file.write(VCF_FILTER % (name, description))
-        in_memory_file.write(VCF_FORMAT)
-        in_memory_file.write(VCF_REFERENCE % reference)
-        in_memory_file.write(VCF_HDR_LINE % sample_id)
-
-        # Rewind to the beginning of the file buffer to prepare for reading
-        in_memory_file.seek(0)
-
-        # Feed the template to pyVcf and write the header to our vcf file
-        vcf_template = vcf.Reader(in_memory_file)
-        self.pyvcf_writer = vcf.Writer(self.file_handle, template=vcf_template)
-
-        # Extract the format string from the header.  It will be the same for
-        # all positions, so only do this once.
-        format_lines = VCF_FORMAT.split('\n')
-        format_lines = [line for line in format_lines if len(line) > 0]
-        format_lines = [line.replace("##FORMAT=<ID=", "") for line in format_lines]
-        tokens = [line.split(',')[0] for line in format_lines]
-        self.format_str = ':'.join(tokens)
-        self.VcfCallData = collections.namedtuple('VcfCallData', tokens)  # this creates a new class called VcfCallData
+            write(VCF_FILTER % (name, description))
+        write(VCF_HDR_LINE % sample_id)
+
+        # The format string and call data class are the same for all positions
+        # and all writers, so they are created once at module import.
+        self.format_str = _FORMAT_STR
+        self.VcfCallData = _VcfCallData
+
+        # Pre-bind one specialized line emitter per filter outcome.  The ID,
+        # QUAL, INFO, and FORMAT columns never change after the header is
+        # written, so the constant middle of each line is concatenated once
+        # here instead of once per record.
+        self._emit_pass, self._emit_fail = self._make_emitters()
+
+    def _make_emitters(self):
+        """Build the specialized per-record line formatters.
+
+        Returns
+        -------
+        emit_pass : callable
+            Closure writing one data line for a position passing all filters.
+            Called with (chrom, pos_str, ref, alt_str, sample_str).
+        emit_fail : callable
+            Closure writing one data line for a position failing filters.
+            Called with (chrom, pos_str, ref, alt_str, filter_str, sample_str).
+        """
+        write = self._write_text
+        out_buf = self._out_buf
+        append = out_buf.append
+        pass_middle = "\t.\tPASS\tNS=1\t" + self.format_str + "\t"
+        fail_middle = "\tNS=1\t" + self.format_str + "\t"
+
+        # Batch the formatted lines and write them in 4096-record chunks to
+        # amortize the per-write overhead; close() flushes the remainder
+        def emit_pass(chrom, pos_str, ref, alt_str, sample_str):
+            append(chrom + "\t" + pos_str + "\t.\t" + ref + "\t" + alt_str + pass_middle + sample_str + "\n")
+            if len(out_buf) >= 4096:
+                write(''.join(out_buf))
+                del out_buf[:]
+
+        def emit_fail(chrom, pos_str, ref, alt_str, filter_str, sample_str):
+            append(chrom + "\t" + pos_str + "\t.\t" + ref + "\t" + alt_str + "\t.\t" + filter_str + fail_middle + sample_str + "\n")
+            if len(out_buf) >= 4096:
+                write(''.join(out_buf))
+                del out_buf[:]
+
+        return emit_pass, emit_fail
 
     def _make_vcf_record_from_pileup(self, pileup_record, failed_filters, failed_snp_gt):
         """
@@ -407,6 +492,7 @@ class SingleSampleWriter(object):
         >>> # Verify ALT=. and GT=. when there is no depth
         >>> r = pileup.Record(['ID', 42, 'G', 0, '', ''], 15)
         >>> writer.write_from_pileup(r, ["Fail"], '.')
+        >>> writer.flush()
         >>> line = _read_last_line(in_memory_file)
         >>> chrom, pos, id, ref, alt, qual, filter, info, format, data = line.split()
         >>> chrom, pos, id, ref, alt, qual, filter, info, format, data
@@ -415,6 +501,7 @@ class SingleSampleWriter(object):
         >>> # Verify alternate allele is identified and called when there is only one alt allele
         >>> r = pileup.Record(['ID', 42, 'G', 14, 'aaaaAAAA...,,,', '00001111222333'], 15)
         >>> writer.write_from_pileup(r, None, '.')
+        >>> writer.flush()
         >>> line = _read_last_line(in_memory_file)
         >>> chrom, pos, id, ref, alt, qual, filter, info, format, data = line.split()
         >>> chrom, pos, id, ref, alt, qual, filter, info, format, data
@@ -423,16 +510,73 @@ class SingleSampleWriter(object):
         >>> # Verify alternate alleles are sorted by frequency, then alphabetical order when there are multiple alt alleles
         >>> r = pileup.Record(['ID', 42, 'G', 23, 'TttaaAAAcCC.......,,,,,', '00011111222333333333333'], 15)
         >>> writer.write_from_pileup(r, None, '.')
+        >>> writer.flush()
         >>> line = _read_last_line(in_memory_file)
         >>> chrom, pos, id, ref, alt, qual, filter, info, format, data = line.split()
         >>> chrom, pos, id, ref, alt, qual, filter, info, format, data
         ('ID', '42', '.', 'G', 'A,C,T', '.', 'PASS', 'NS=1', 'GT:SDP:RD:AD:RDF:RDR:ADF:ADR:FT', '0:23:12:5,3,3:7:5:3,2,1:2,1,2:PASS')
         """
-        # Create the PyVCF record
-        vcf_record = self._make_vcf_record_from_pileup(pileup_record, failed_filters, failed_snp_gt)
+        # Serialize the record directly instead of building PyVCF model
+        # objects that would immediately be re-flattened to a line of text.
+        # PyVCF's per-record object construction dominates the emission cost.
+        # The emitted bytes match the PyVCF writer output exactly.
+        ref, upper_ref = self._ref_case(pileup_record.reference_base)
+
+        # Bind the remaining record attributes to locals -- attribute access
+        # is comparatively slow and this method runs once per position
+        most_common_good_bases = pileup_record.most_common_good_bases
+        base_depth = pileup_record.base_good_depth
+        forward_depth = pileup_record.forward_base_good_depth
+        reverse_depth = pileup_record.reverse_base_good_depth
+
+        if most_common_good_bases is None:  # no good depth
+            alt_str = '.'
+            gt = '.'
+            ad = adf = adr = '0'
+        else:
+            if len(most_common_good_bases) == 1 and most_common_good_bases[0] == upper_ref:
+                # Only the reference base was seen -- the usual case at most
+                # positions -- so skip the alt list work entirely
+                alt_str = '.'
+                gt = '0'
+                ad = adf = adr = '0'
+            else:
+                # Collect the alt bases and all three depth columns in one pass,
+                # with one lookup per depth dict per base
+                alt = []
+                ad_list = []
+                adf_list = []
+                adr_list = []
+                for base in most_common_good_bases:
+                    if base == upper_ref:
+                        continue
+                    alt.append(base)
+                    ad_list.append(str(base_depth[base]))
+                    adf_list.append(str(forward_depth[base]))
+                    adr_list.append(str(reverse_depth[base]))
+                alt_str = ','.join(alt)
+                gt = '0' if most_common_good_bases[0] == upper_ref else '1'
+                ad = ','.join(ad_list)
+                adf = ','.join(adf_list)
+                adr = ','.join(adr_list)
 
-        # Tell PyVCF to write the record
-        self.pyvcf_writer.write_record(vcf_record)
+            if failed_filters:
+                # The gt override was resolved once by set_failed_snp_gt
+                if failed_snp_gt != self._failed_snp_gt:
+                    self.set_failed_snp_gt(failed_snp_gt)
+                gt = self._failed_gt
+
+        sdp = pileup_record.raw_depth
+        rd = base_depth[upper_ref]
+        rdf = forward_depth[upper_ref]
+        rdr = reverse_depth[upper_ref]
+        if failed_filters:
+            ft = ';'.join(failed_filters)
+            sample_str = ':'.join([gt, str(sdp), str(rd), ad, str(rdf), str(rdr), adf, adr, ft])
+            self._emit_fail(pileup_record.chrom, str(pileup_record.position), ref, alt_str, ft, sample_str)
+        else:
+            sample_str = ':'.join([gt, str(sdp), str(rd), ad, str(rdf), str(rdr), adf, adr, "PASS"])
+            self._emit_pass(pileup_record.chrom, str(pileup_record.position), ref, alt_str, sample_str)
 
 
 def _read_last_line(stream):
@@ -21,6 +21,10 @@ import snppipeline as source_package
 def load_module_by_path(path):
     """Load a python module from its path.
 
+    The module is imported through the normal import machinery, so a module
+    already imported elsewhere in the test run is reused instead of being
+    recompiled from source.
+
     Parameters
     ----------
     path : str
@@ -31,12 +35,13 @@ def load_module_by_path(path):
     mod : module
         Loaded module.
     """
-    import imp
+    import importlib
 
     module_file_basename = os.path.basename(path)
     module_name, ext = os.path.splitext(module_file_basename)
-    mod = imp.load_source(module_name, path)
-    return mod
+    if module_name == "__init__":
+        return source_package
+    return importlib.import_module(source_package.__name__ + "." + module_name)
 
 
 def file_contains_doctests(path):